@@ -9,12 +9,8 @@
 from __future__ import print_function, absolute_import, unicode_literals
 
 import sys
-import simplejson
 from docopt import docopt
-from schema import Schema, And, Or, Use, Optional, SchemaError
-from setup import VERSION
-from hearthpacks import Console
-from hearthpacks.packs import PACKS_TYPE
+from hearthpacks_constants import VERSION, PACKS_TYPE, CACHE_DIR, SESSION_FILE
 
 INTRO = """HearthPacks.py {ver}
 Spam pack opening of HearthPwn.com to get the best score possible.
@@ -24,16 +20,29 @@ AUTHOR = """Original program by Arzaroth <lekva@arzaroth.com>."""
 
 __doc__ = """{intro}
 Usage:
+  HearthPacks.py stats [-c FILE] [-v] [--journal DIR] [--card CARD]
+                       [--golden] [--percentile NUMBER] [--by-day]
+                       [--limit NUMBER] [PACK_TYPE]
   HearthPacks.py [-ngc FILE] [-v | -vv] [--attempts NUMBER] [--score NUMBER]
                  [--threshold NUMBER] [--low-threshold NUMBER]
                  [--threshold-comment TEXT] [--low-threshold-comment TEXT]
-                 [--wait SECONDS] [PACK_TYPE]
+                 [--wait SECONDS] [--workers NUMBER] [--rate NUMBER]
+                 [--async] [--cache-dir DIR] [--cache-size MB]
+                 [--retries NUMBER] [--session-file FILE]
+                 [--journal DIR] [--min-gain NUMBER]
+                 [--target-percentile NUMBER] [--min-rate NUMBER]
+                 [--max-rate NUMBER] [--metrics-port PORT]
+                 [--metrics-interval SECONDS] [--profile FILE]
+                 [--trace FILE] [--parse-processes NUMBER] [--stream]
+                 [PACK_TYPE]
   HearthPacks.py -h
   HearthPacks.py --version
 
 Arguments:
   PACK_TYPE                             Type of packs to be opened,
-                                        case insensitive, see Notes
+                                        case insensitive, see Notes.
+                                        With stats, restricts the query to
+                                        this type of packs
 
 Options:
   -n, --anonymous                       Open and save packs as anonymous
@@ -55,6 +64,82 @@ Options:
                                         [default: Low Threshold]
   -w SECONDS, --wait=SECONDS            Number of seconds between two packs
                                         opening [default: 2]
+  -j NUMBER, --workers=NUMBER           Number of packs opened concurrently
+                                        [default: 1]
+  -r NUMBER, --rate=NUMBER              Maximum number of packs opened per
+                                        second, shared by all workers.
+                                        Replaces --wait when set
+  --max-rate=NUMBER                     Pace pack openings adaptively instead
+                                        of waiting, starting from --rate and
+                                        raising it up to this number of packs
+                                        per second while HearthPwn.com answers
+                                        quickly, halving it on errors, timeouts
+                                        and slow responses
+  --min-rate=NUMBER                     Lowest rate of adaptive pacing, in packs
+                                        per second [default: 0.1]
+  --metrics-port=PORT                   Serve counters and latency histograms
+                                        in the Prometheus text format on
+                                        http://127.0.0.1:PORT/metrics in
+                                        console mode
+  --metrics-interval=SECONDS            Print a one-line summary of the
+                                        metrics every SECONDS seconds in
+                                        console mode, 0 to disable it
+                                        [default: 0]
+  --async                               Open packs on an asyncio event loop
+                                        in console mode, --workers being the
+                                        number of requests in flight.
+                                        Requires aiohttp
+  --cache-dir=DIR                       Directory of the card images cache,
+                                        defaults to {cache_dir}
+  --cache-size=MB                       Maximum size of the card images cache
+                                        in megabytes, 0 to disable it
+                                        [default: 200]
+  --retries=NUMBER                      Number of times a failed connection
+                                        or pack opening is retried, with an
+                                        exponential backoff [default: 2]
+  --session-file=FILE                   File where login sessions are saved
+                                        to be reused by the next runs, an
+                                        empty string in the configuration
+                                        file disables it
+                                        [default: {session_file}]
+  --journal=DIR                         Directory of the history of every
+                                        opened and saved pack, kept as
+                                        size-rotated JSON lines segments
+  --min-gain=NUMBER                     Stop opening packs once the expected
+                                        improvement of the best score over
+                                        the remaining attempts falls below
+                                        this value, estimated from the scores
+                                        seen so far
+  --target-percentile=NUMBER            Replace --threshold by this percentile
+                                        of the scores seen so far, from 0 to
+                                        100
+  --parse-processes=NUMBER              Parse pack pages in a pool of NUMBER
+                                        processes in console mode, so parsing
+                                        is not bound to one core and the
+                                        opening threads only wait for the
+                                        network
+  --stream                              Read pack pages by chunks in console
+                                        mode, parsing them as they arrive and
+                                        closing the connection as soon as the
+                                        pack is found, at the cost of a new
+                                        connection for each pack
+  --profile=FILE                        Profile the run in console mode,
+                                        saving the cProfile statistics in FILE
+                                        and printing the time spent in each
+                                        phase of the pack lifecycle
+  --trace=FILE                          Save a span for every phase of every
+                                        pack in FILE, in the Chrome trace
+                                        event format, in console mode
+  --card=CARD                           With stats, show the best packs
+                                        holding this card, by id or name
+  --golden                              With --card, only count golden cards
+  --percentile=NUMBER                   With stats, show this percentile of
+                                        the scores of each type of packs,
+                                        from 0 to 100
+  --by-day                              With stats, show the best pack of
+                                        each day
+  --limit=NUMBER                        Number of packs or days shown by
+                                        stats [default: 10]
   -v, --verbose                         Print more text
                                         Can be specified multiple times to
                                         print event more text
@@ -71,19 +156,35 @@ Notes:
   The file can contain any option specified here, plus two extra keys,
   "email" and "password".
   Configuration file take over command line arguments.
+  In console mode, the file can instead hold an "accounts" list, each
+  account having its own "email" and "password" and overriding any other
+  option, PACK_TYPE included. One process is then started per account,
+  restarted if it crashes, and their stats and best packs are summed up
+  once they are all done. The journal of each account is kept in its own
+  subdirectory of --journal, and --metrics-port is shifted by the index of
+  the account.
   You can look at the examples provided with the source code.
 
+  The stats command answers queries over the packs recorded in --journal,
+  the journals of the accounts included. They are kept in an index next to
+  the journal, updated with the new records each time the command is run.
+  Card names are known from the cards recorded since this version.
+  Without a query, it shows the number of packs and the scores of each type.
+
 Disclaimer:
   I am not affiliated in any way to HearthPwn.com.
   This is an automatization tool, no more.
 
 Author:
   {author}
-""".format(intro=INTRO, author=AUTHOR, pack_types=', '.join(PACKS_TYPE))
+""".format(intro=INTRO, author=AUTHOR, pack_types=', '.join(PACKS_TYPE),
+           cache_dir=CACHE_DIR, session_file=SESSION_FILE)
 
-def parse_args():
-    opts = docopt(__doc__, version='.'.join(VERSION))
-    schema = Schema({
+def options_schema():
+    """Returns the schema validating and converting the options. Only
+imported once --help and --version have been handled."""
+    from schema import Schema, And, Or, Use, Optional
+    return Schema({
         Optional('PACK_TYPE'):
         Or(None, lambda s: s.lower() in PACKS_TYPE,
            error="PACK_TYPE should be either %s" % (', '.join(PACKS_TYPE))),
@@ -105,24 +206,112 @@ def parse_args():
         Optional('--wait'):
         And(Use(int), lambda n: n >= 0,
             error='--wait must be a positive integer'),
+        Optional('--workers'):
+        And(Use(int), lambda n: n > 0,
+            error='--workers must be a strictly positive integer'),
+        Optional('--cache-size'):
+        And(Use(int), lambda n: n >= 0,
+            error='--cache-size must be a positive integer'),
+        Optional('--retries'):
+        And(Use(int), lambda n: n >= 0,
+            error='--retries must be a positive integer'),
+        Optional('--min-gain'):
+        Or(None, And(Use(float), lambda n: n >= 0),
+           error='--min-gain must be a positive number'),
+        Optional('--target-percentile'):
+        Or(None, And(Use(float), lambda n: 0 <= n <= 100),
+           error='--target-percentile must be a number between 0 and 100'),
+        Optional('--min-rate'):
+        And(Use(float), lambda n: n > 0,
+            error='--min-rate must be a strictly positive number'),
+        Optional('--max-rate'):
+        Or(None, And(Use(float), lambda n: n > 0),
+           error='--max-rate must be a strictly positive number'),
+        Optional('--metrics-port'):
+        Or(None, And(Use(int), lambda n: 0 < n < 65536),
+           error='--metrics-port must be a valid port number'),
+        Optional('--metrics-interval'):
+        And(Use(float), lambda n: n >= 0,
+            error='--metrics-interval must be a positive number'),
+        Optional('--parse-processes'):
+        Or(None, And(Use(int), lambda n: n > 0),
+           error='--parse-processes must be a strictly positive integer'),
+        Optional('--rate'):
+        Or(None, And(Use(float), lambda n: n > 0),
+           error='--rate must be a strictly positive number'),
+        Optional('--percentile'):
+        Or(None, And(Use(float), lambda n: 0 <= n <= 100),
+           error='--percentile must be a number between 0 and 100'),
+        Optional('--limit'):
+        And(Use(int), lambda n: n > 0,
+            error='--limit must be a strictly positive integer'),
         object: object,
     })
+
+def account_options(schema, opts, account):
+    """Validate the options of an account merged over the global ones,
+returning its own options, converted."""
+    from schema import SchemaError
+    merged = dict(opts, **account)
+    merged['--config'] = None
+    try:
+        merged = schema.validate(merged)
+    except SchemaError as e:
+        raise SchemaError('account %s: %s' % (account.get('email') or 'anonymous', e))
+    return dict((key, merged[key]) for key in account)
+
+def parse_args(opts):
+    """Validate the options parsed by docopt and merge the configuration
+file in, validating the options of each account."""
+    import simplejson
+    from schema import Schema, And
+    schema = options_schema()
     opts = schema.validate(opts)
-    opts['PACK_TYPE'] = opts['PACK_TYPE'].lower() if opts['PACK_TYPE'] else "wild"
+    if opts['PACK_TYPE']:
+        opts['PACK_TYPE'] = opts['PACK_TYPE'].lower()
+    elif not opts.get('stats'):
+        opts['PACK_TYPE'] = "wild"
     if opts['--config']:
         config = simplejson.loads(opts['--config'].read())
         opts.update(config)
+    if opts.get('accounts'):
+        account = lambda a: dict(opts, **a)
+        Schema([And(dict, lambda a: account(a)['--anonymous'] or
+                    ('email' in account(a) and 'password' in account(a)))],
+               error='every account needs an "email" and a "password"'
+               ).validate(opts['accounts'])
+        opts['accounts'] = [account_options(schema, opts, account)
+                            for account in opts['accounts']]
     return opts
 
 if __name__ == '__main__':
+    opts = docopt(__doc__, version='.'.join(VERSION))
+    import simplejson
+    from schema import SchemaError
     try:
-        opts = parse_args()
+        opts = parse_args(opts)
     except (SchemaError, simplejson.decoder.JSONDecodeError) as e:
         print('Error: %s' % (str(e)), file=sys.stderr)
         ret = 1
     else:
-        if opts['--no-gui']:
-            ret = Console(opts).run()
+        if opts['stats']:
+            from hearthpacks.stats import run
+            ret = run(opts)
+        elif opts['--no-gui'] and opts.get('accounts'):
+            from hearthpacks.supervisor import Supervisor
+            ret = Supervisor(opts).run()
+        elif opts['--no-gui']:
+            if opts['--async']:
+                from hearthpacks.aio import AsyncConsole
+                console = AsyncConsole(opts)
+            else:
+                from hearthpacks.console import Console
+                console = Console(opts)
+            if opts['--profile'] or opts['--trace']:
+                from hearthpacks.profiling import run_profiled
+                ret = run_profiled(opts, console.run)
+            else:
+                ret = console.run()
         else:
             from hearthpacks.gui import Gui
             ret = Gui(opts).run()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: bench_gui.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""GUI benchmark against the local HearthPwn.com stand-in.
+Runs the pack opener window offscreen, submitting every pack: a full run,
+a run stopped midway and another full run. Reports the packs opened,
+submitted and shown by each run and the longest stall of the GUI thread,
+and fails if a run does not complete, a submitted pack is not shown, or a
+golden card shown is not playing.
+
+Usage:
+  bench_gui.py [--attempts NUMBER] [--workers NUMBER] [--latency SECONDS]
+               [--stop-after SECONDS] [--timeout SECONDS] [--broken-images]
+               [--cache-dir DIR] [--port PORT] [PACK_TYPE]
+
+Options:
+  -a NUMBER, --attempts=NUMBER          Number of packs to open by run
+                                        [default: 200]
+  -j NUMBER, --workers=NUMBER           Number of requests in flight
+                                        [default: 4]
+  -l SECONDS, --latency=SECONDS         Server delay on every response
+                                        [default: 0.005]
+  --stop-after=SECONDS                  Time after which the second run is
+                                        stopped [default: 0.3]
+  --timeout=SECONDS                     Time after which the benchmark is
+                                        given up [default: 60]
+  --broken-images                       Serve card images that cannot be
+                                        decoded, the cards being shown by
+                                        name instead
+  --cache-dir=DIR                       Load card images through a cache in
+                                        DIR, which is left in place so it
+                                        can be reused by the next run
+  -p PORT, --port=PORT                  Port of the stand-in, which must be
+                                        the same for the next run to reuse
+                                        the cache, 0 picks a free one
+                                        [default: 0]
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import time
+import struct
+from docopt import docopt
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+try:
+    from PyQt5 import QtCore, QtGui
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    raise SystemExit("PyQt5 not found. Unable to run the GUI benchmark.")
+from server import StandInServer, rebase
+import HearthPacks
+from hearthpacks.login import login
+from hearthpacks import images, metrics
+from hearthpacks.packs import PACKS_TYPE
+from hearthpacks.gui.packs import PackOpenerWindow
+
+STALL_INTERVAL = 10
+SETTLE_DELAY = 1000
+
+def gif(width=200, height=300, frames=2, delay=10):
+    """Returns a looping GIF animation of width by height pixels, showing
+frames times a single pixel for delay hundredths of a second."""
+    frame = (b'!\xf9\x04\x00' + struct.pack('<H', delay) + b'\x00\x00' +
+             b',' + struct.pack('<HHHH', 0, 0, 1, 1) + b'\x00\x02\x02D\x01\x00')
+    return (b'GIF89a' + struct.pack('<HH', width, height) +
+            b'\x80\x00\x00\x00\x00\x00\xff\xff\xff' +
+            b'!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00' + frame * frames + b';')
+
+def png(width=200, height=300):
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(70, 130, 180))
+    data = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(data)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(data)
+
+
+class ImageStandInServer(StandInServer):
+    """Stand-in serving card images that can be decoded, unless broken."""
+    def __init__(self, broken=False, **kwargs):
+        StandInServer.__init__(self, **kwargs)
+        self.broken = broken
+        self.card_images = {'png': png(), 'gif': gif()}
+
+    def image(self, path, extension):
+        if self.broken:
+            return StandInServer.image(self, path, extension)
+        return self.card_images[extension]
+
+
+class Bench(QtCore.QObject):
+    def __init__(self, opts, window):
+        QtCore.QObject.__init__(self)
+        self.opts = opts
+        self.window = window
+        self.widget = window.packOpener
+        self.runs = []
+        self.stall = 0
+        self.widget.networkPackOpener.submitted.connect(self.submitted)
+        self.widget.networkPackOpener.done.connect(self.done)
+        self.widget.imageLoaderPool.done.connect(self.shown)
+        self.ticker = QtCore.QTimer(self)
+        self.ticker.setInterval(STALL_INTERVAL)
+        self.ticker.timeout.connect(self.tick)
+
+    def start(self):
+        self.last_tick = time.time()
+        self.ticker.start()
+        self.go()
+        if len(self.runs) == 2:
+            QtCore.QTimer.singleShot(int(float(self.opts['--stop-after']) * 1000),
+                                     self.widget.stopButton.click)
+
+    def go(self):
+        self.runs.append({'submitted': 0, 'shown': 0, 'start': time.time()})
+        self.widget.goButton.click()
+
+    def tick(self):
+        now = time.time()
+        self.stall = max(self.stall, now - self.last_tick - STALL_INTERVAL / 1000)
+        self.last_tick = now
+
+    def submitted(self, pack):
+        self.runs[-1]['submitted'] += 1
+
+    def shown(self, result):
+        self.runs[-1]['shown'] += 1
+
+    def done(self):
+        run = self.runs[-1]
+        run['wall'] = time.time() - run['start']
+        run['opened'] = self.widget.count
+        if len(self.runs) < 3:
+            QtCore.QTimer.singleShot(0, self.start)
+        else:
+            QtCore.QTimer.singleShot(SETTLE_DELAY, QApplication.instance().quit)
+
+    def report(self):
+        attempts = int(self.opts['--attempts'])
+        print('%-8s %8s %10s %8s %10s' % ('run', 'opened', 'submitted', 'shown', 'packs/s'))
+        for name, run in zip(('full', 'stopped', 'full'), self.runs):
+            print('%-8s %8d %10d %8d %10.1f' % (name, run.get('opened', 0), run['submitted'],
+                                                run['shown'], run.get('opened', 0) /
+                                                max(run.get('wall', 1), 1e-3)))
+        labels = self.widget.cardLabels
+        if self.opts['--broken-images']:
+            shown = sum(1 for label in labels if label.isVisible() and
+                        label.text() == label.card.name)
+        else:
+            shown = sum(1 for label in labels if label.isVisible() and
+                        (label.movie() is not None or
+                         (label.pixmap() is not None and not label.pixmap().isNull())))
+        print()
+        print('cards shown        %10d/%d' % (shown, len(labels)))
+        print('longest GUI stall  %10.1f ms' % (self.stall * 1000))
+        print('images from memory %10d\n             disk %10d\n          network %10d' % (
+            metrics.IMAGES_MEMORY.value, metrics.IMAGES_DISK.value, metrics.IMAGES_NETWORK.value))
+        ret = 0
+        if len(self.runs) < 3 or any(run.get('opened') != attempts
+                                     for run in (self.runs[0], self.runs[2])):
+            print('a full run did not open all of its packs')
+            ret = 1
+        if (sum(run['shown'] for run in self.runs) !=
+            sum(run['submitted'] for run in self.runs)):
+            print('a submitted pack was not shown')
+            ret = 1
+        if shown != len(labels):
+            print('the cards of the last pack are not all shown')
+            ret = 1
+        if not self.opts['--broken-images'] and any(
+                label.movie() is not None and
+                (not label.movie().isValid() or
+                 label.movie().state() != QtGui.QMovie.Running)
+                for label in labels):
+            print('a golden card of the last pack is not playing')
+            ret = 1
+        return ret
+
+
+def main():
+    opts = docopt(__doc__)
+    if opts['PACK_TYPE'] and opts['PACK_TYPE'] not in PACKS_TYPE:
+        print('PACK_TYPE should be either %s' % (', '.join(PACKS_TYPE)), file=sys.stderr)
+        return 1
+    server = ImageStandInServer(broken=opts['--broken-images'], port=int(opts['--port']),
+                                latency=float(opts['--latency'])).start()
+    try:
+        rebase(server.url)
+        app_opts = HearthPacks.parse_args(docopt(HearthPacks.__doc__, argv=[
+            '--anonymous', '--attempts', opts['--attempts'], '--workers', opts['--workers'],
+            '--threshold', '0', '--wait', '0', '--session-file', '',
+            '--cache-size', '200' if opts['--cache-dir'] else '0',
+            '--cache-dir', opts['--cache-dir'] or '', opts['PACK_TYPE'] or 'wild']))
+        app = QApplication([])
+        session = login(app_opts)
+        images.configure(app_opts, session)
+        window = PackOpenerWindow(app_opts, session)
+        window.show()
+        bench = Bench(opts, window)
+        QtCore.QTimer.singleShot(0, bench.start)
+        QtCore.QTimer.singleShot(int(float(opts['--timeout']) * 1000), app.quit)
+        app.exec_()
+        return bench.report()
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
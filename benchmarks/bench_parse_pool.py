@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: bench_parse_pool.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""Parsing offload benchmark.
+Opening threads wait for a simulated network delay, then build a Pack from
+a fixture page, either parsing it themselves or through a pool of parsing
+processes as with --parse-processes. Reports packs/sec for every number of
+processes up to the number of cores.
+
+Usage:
+  bench_parse_pool.py [--packs NUMBER] [--workers NUMBER] [--latency SECONDS]
+                      [--processes NUMBER]
+
+Options:
+  -n NUMBER, --packs=NUMBER             Number of packs to build per run
+                                        [default: 2000]
+  -j NUMBER, --workers=NUMBER           Number of opening threads
+                                        [default: 16]
+  -l SECONDS, --latency=SECONDS         Simulated network delay before every
+                                        page [default: 0.005]
+  -p NUMBER, --processes=NUMBER         Largest pool to try, defaults to the
+                                        number of cores
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import glob
+import time
+import threading
+import multiprocessing
+from docopt import docopt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+from hearthpacks.console import parser_pool
+from hearthpacks.packs import Pack
+from hearthpacks.parser import parse_pack
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+
+def run(pages, packs, workers, latency, parsers):
+    lock = threading.Lock()
+    remaining = [packs]
+
+    def worker():
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+                content = pages[remaining[0] % len(pages)]
+            time.sleep(latency)
+            if parsers:
+                pack = Pack(record=parsers.submit(parse_pack, content).result())
+            else:
+                pack = Pack(content=content)
+            assert pack.score > 0
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return packs / (time.time() - start)
+
+def main():
+    opts = docopt(__doc__)
+    packs, workers = int(opts['--packs']), int(opts['--workers'])
+    latency = float(opts['--latency'])
+    processes = int(opts['--processes'] or multiprocessing.cpu_count())
+    pages = []
+    for fixture in sorted(glob.glob(os.path.join(FIXTURES, 'simulator-*.html'))):
+        with open(fixture, 'rb') as f:
+            pages.append(f.read())
+    print('%d cores, %d opening threads, %.1f ms latency' % (
+        multiprocessing.cpu_count(), workers, latency * 1000))
+    baseline = run(pages, packs, workers, latency, None)
+    print('%-12s %10.1f packs/sec' % ('in threads', baseline))
+    for count in range(1, processes + 1):
+        parsers = parser_pool({'--parse-processes': count})
+        try:
+            rate = run(pages, packs, workers, latency, parsers)
+        finally:
+            parsers.shutdown()
+        print('%-12s %10.1f packs/sec  x%.2f' % (
+            '%d process%s' % (count, 'es' if count > 1 else ''), rate, rate / baseline))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
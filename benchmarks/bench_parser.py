@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: bench_parser.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""Pack page parsing benchmark.
+Checks that the streaming parser extracts the same pack as the
+BeautifulSoup one on every fixture page, then times both of them.
+
+Usage:
+  bench_parser.py [--number NUMBER] [FIXTURE...]
+
+Options:
+  -n NUMBER, --number=NUMBER            Number of parses per fixture
+                                        [default: 200]
+"""
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import glob
+import timeit
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from hearthpacks.parser import parse_pack, parse_pack_soup
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def main():
+    opts = docopt(__doc__)
+    number = int(opts['--number'])
+    fixtures = opts['FIXTURE'] or sorted(glob.glob(os.path.join(FIXTURES, 'simulator-*.html')))
+    ret = 0
+    for fixture in fixtures:
+        with open(fixture, 'rb') as f:
+            content = f.read()
+        expected = parse_pack_soup(content)
+        if parse_pack(content) != expected:
+            print('%s: parsers disagree' % (os.path.basename(fixture)), file=sys.stderr)
+            print(parse_pack(content), file=sys.stderr)
+            print(expected, file=sys.stderr)
+            ret = 1
+            continue
+        stream = timeit.timeit(lambda: parse_pack(content), number=number) / number
+        soup = timeit.timeit(lambda: parse_pack_soup(content), number=number) / number
+        print('%-24s %7d bytes  stream %8.3f ms  soup %8.3f ms  x%.1f' % (
+            os.path.basename(fixture), len(content), stream * 1000, soup * 1000, soup / stream))
+    return ret
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: bench_run.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""End to end benchmark against the local HearthPwn.com stand-in.
+Starts server.py in a separate process, then drives login, opening,
+saving and image loading, reporting throughput, latency per phase,
+and CPU and memory per pack.
+
+Usage:
+  bench_run.py [--attempts NUMBER] [--workers NUMBER] [--logins NUMBER]
+               [--saves NUMBER] [--images NUMBER] [--memory-packs NUMBER]
+               [--latency SECONDS] [--jitter SECONDS] [--error-rate RATE]
+               [--seed NUMBER] [--cache-dir DIR] [--stream] [PACK_TYPE]
+
+Options:
+  -a NUMBER, --attempts=NUMBER          Number of packs to open [default: 500]
+  -j NUMBER, --workers=NUMBER           Number of opening threads [default: 1]
+  --logins=NUMBER                       Number of logins [default: 5]
+  --saves=NUMBER                        Number of packs to save [default: 50]
+  --images=NUMBER                       Number of card images to load
+                                        [default: 50]
+  --memory-packs=NUMBER                 Number of packs retained to measure
+                                        memory per pack [default: 200]
+  -l SECONDS, --latency=SECONDS         Server delay on every response
+                                        [default: 0]
+  --jitter=SECONDS                      Random extra server delay
+                                        [default: 0]
+  -e RATE, --error-rate=RATE            Probability of a server error on
+                                        simulator and save requests
+                                        [default: 0]
+  -s NUMBER, --seed=NUMBER              Seed of the server random generator
+                                        [default: 0]
+  --cache-dir=DIR                       Load card images through a cache in
+                                        DIR, which is left in place so it
+                                        can be reused by the next run
+  --stream                              Read the simulator pages by chunks,
+                                        stopping once the pack is parsed
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import time
+import resource
+import threading
+import subprocess
+import tracemalloc
+from docopt import docopt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+from server import rebase
+from hearthpacks.login import login
+from hearthpacks.packs import PackOpener, PackError
+from hearthpacks import images, metrics
+from hearthpacks.transport import connection_stats
+from hearthpacks.packs import Card, PACKS_TYPE
+
+def bench_opts(opts):
+    return {
+        'PACK_TYPE': opts['PACK_TYPE'] or 'wild',
+        'email': 'bench@hearthpacks.local',
+        'password': 'bench',
+        '--anonymous': False,
+        '--verbose': 0,
+        '--score': 0,
+        '--threshold': sys.maxsize,
+        '--threshold-comment': 'Threshold',
+        '--low-threshold': 0,
+        '--low-threshold-comment': 'Low Threshold',
+        '--wait': 0,
+        '--rate': None,
+        '--min-rate': 0.1,
+        '--max-rate': None,
+        '--workers': int(opts['--workers']),
+        '--retries': 0,
+        '--session-file': None,
+        '--min-gain': None,
+        '--target-percentile': None,
+        '--cache-dir': opts['--cache-dir'],
+        '--cache-size': 200 if opts['--cache-dir'] else 0,
+        '--stream': opts['--stream'],
+    }
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def timed(latencies, func, *args):
+    start = time.time()
+    try:
+        return func(*args)
+    finally:
+        latencies.append(time.time() - start)
+
+
+class Bench(object):
+    def __init__(self, opts):
+        self.opts = bench_opts(opts)
+        self.attempts = int(opts['--attempts'])
+        self.logins = int(opts['--logins'])
+        self.saves = int(opts['--saves'])
+        self.images = int(opts['--images'])
+        self.memory_packs = int(opts['--memory-packs'])
+        self.latencies = dict((phase, []) for phase in ('login', 'open', 'save', 'image'))
+        self.failures = dict((phase, 0) for phase in self.latencies)
+        self.packs = []
+
+    def run_login(self):
+        for i in range(self.logins):
+            session = timed(self.latencies['login'], login, self.opts)
+        return session
+
+    def run_open(self, pack_opener):
+        lock = threading.Lock()
+        attempts = iter(range(self.attempts))
+
+        def worker():
+            while True:
+                with lock:
+                    if next(attempts, None) is None:
+                        return
+                try:
+                    pack = timed(self.latencies['open'], pack_opener.open_pack)
+                except PackError:
+                    pack = None
+                with lock:
+                    if pack is None:
+                        self.failures['open'] += 1
+                    elif len(self.packs) < self.saves:
+                        self.packs.append(pack)
+
+        threads = [threading.Thread(target=worker) for _ in range(self.opts['--workers'])]
+        start, cpu = time.time(), time.process_time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start, time.process_time() - cpu
+
+    def run_save(self, pack_opener):
+        for pack in self.packs[:self.saves]:
+            try:
+                r = timed(self.latencies['save'], pack_opener.save_pack, "Bench", pack)
+            except PackError:
+                r = None
+            if not r:
+                self.failures['save'] += 1
+
+    def run_image(self):
+        cards = [card for pack in self.packs for card in pack.cards]
+        for i in range(min(self.images, len(cards))):
+            card = cards[i]
+            card = Card(card.card_id, card.golden, card.name, card.img_src,
+                        card.width, card.height)
+            if not timed(self.latencies['image'], getattr, card, 'image_data'):
+                self.failures['image'] += 1
+
+    def run_memory(self, pack_opener):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        retained = []
+        for i in range(self.memory_packs):
+            try:
+                retained.append(pack_opener.open_pack())
+            except PackError:
+                pass
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        return size / max(len(retained), 1)
+
+    def run(self):
+        session = self.run_login()
+        images.configure(self.opts, session)
+        pack_opener = PackOpener(self.opts, session)
+        wall, cpu = self.run_open(pack_opener)
+        self.run_save(pack_opener)
+        self.run_image()
+        memory = self.run_memory(pack_opener) if self.memory_packs else float('nan')
+        opened = self.attempts - self.failures['open']
+        print('%-8s %8s %8s %10s %10s' % ('phase', 'count', 'failed', 'p50 ms', 'p99 ms'))
+        for phase, latencies in self.latencies.items():
+            print('%-8s %8d %8d %10.2f %10.2f' % (
+                phase, len(latencies), self.failures[phase],
+                percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+        print()
+        print('packs/sec          %10.1f' % (opened / wall))
+        print('CPU per pack       %10.3f ms' % (cpu / max(opened, 1) * 1000))
+        print('memory per pack    %10.0f bytes' % (memory))
+        print('HTTP requests      %10d\nnew connections    %10d' % connection_stats(session))
+        print('bytes read/pack    %10.0f\nbytes unread/pack  %10.0f' % (
+            metrics.BYTES_RECEIVED.value / max(metrics.PACKS_OPENED.value, 1),
+            metrics.BYTES_SKIPPED.value / max(metrics.PACKS_OPENED.value, 1)))
+        print('peak RSS           %10.1f MB' % (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main():
+    opts = docopt(__doc__)
+    if opts['PACK_TYPE'] and opts['PACK_TYPE'] not in PACKS_TYPE:
+        print('PACK_TYPE should be either %s' % (', '.join(PACKS_TYPE)), file=sys.stderr)
+        return 1
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'server.py'),
+                               '--latency', opts['--latency'],
+                               '--jitter', opts['--jitter'],
+                               '--error-rate', opts['--error-rate'],
+                               '--seed', opts['--seed']],
+                              stdout=subprocess.PIPE)
+    try:
+        rebase(server.stdout.readline().decode('ascii').strip())
+        Bench(opts).run()
+    finally:
+        server.terminate()
+        server.wait()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: bench_startup.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""Cold start benchmark of HearthPacks.py.
+Times fresh interpreters printing the version and importing the console
+mode, and fails if the best of the runs goes over the budget, if printing
+the version imports the hearthpacks package, if the console mode imports a
+module it does not use, or if importing it changes what the public names of
+the package are.
+
+Usage:
+  bench_startup.py [--runs NUMBER] [--version-budget MS] [--console-budget MS]
+
+Options:
+  -n NUMBER, --runs=NUMBER              Number of runs of each command, the
+                                        fastest one being kept [default: 10]
+  --version-budget=MS                   Budget of HearthPacks.py --version,
+                                        in milliseconds [default: 150]
+  --console-budget=MS                   Budget of the console mode imports,
+                                        in milliseconds [default: 400]
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import time
+import subprocess
+from docopt import docopt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+UNUSED = ('bs4', 'schema', 'PyQt5', 'PySide', 'aiohttp', 'http.server')
+HEAVY = ('hearthpacks', 'requests', 'simplejson')
+VERSION = """import os
+import sys
+sys.argv = ['HearthPacks.py', '--version']
+stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+try:
+    exec(compile(open('HearthPacks.py').read(), 'HearthPacks.py', 'exec'),
+         {'__name__': '__main__'})
+except SystemExit:
+    pass
+sys.stdout = stdout
+print(' '.join(m for m in %r if m in sys.modules))
+""" % (HEAVY,)
+CONSOLE = """import sys
+from hearthpacks.console import Console
+print(' '.join(m for m in %r if m in sys.modules))
+""" % (UNUSED,)
+API = """import sys
+import hearthpacks.console
+import hearthpacks
+sys.exit(hearthpacks.login is not sys.modules['hearthpacks.login'].login)
+"""
+
+def best_time(command, runs):
+    best, output = float('inf'), b''
+    for i in range(runs):
+        start = time.time()
+        output = subprocess.check_output(command, cwd=ROOT)
+        best = min(best, time.time() - start)
+    return best, output.decode('utf-8').strip()
+
+def api_check():
+    """Returns whether the public names of hearthpacks are still the ones
+the package exports once its submodules are imported."""
+    return subprocess.call([sys.executable, '-c', API], cwd=ROOT) == 0
+
+def main():
+    opts = docopt(__doc__)
+    runs = int(opts['--runs'])
+    ret = 0
+    baseline, _ = best_time([sys.executable, '-c', 'pass'], runs)
+    print('%-12s %10.1f ms' % ('interpreter', baseline * 1000))
+    for name, command, budget in (
+            ('--version', [sys.executable, 'HearthPacks.py', '--version'],
+             float(opts['--version-budget'])),
+            ('console', [sys.executable, '-c', CONSOLE],
+             float(opts['--console-budget']))):
+        elapsed, output = best_time(command, runs)
+        over = elapsed * 1000 > budget
+        print('%-12s %10.1f ms  budget %6.0f ms%s' % (
+            name, elapsed * 1000, budget, '  OVER BUDGET' if over else ''))
+        if name == '--version':
+            _, output = best_time([sys.executable, '-c', VERSION], 1)
+            if output:
+                print('--version imports: %s' % (output))
+                ret = 1
+        if name == 'console' and output:
+            print('console mode imports unused modules: %s' % (output))
+            ret = 1
+        if name == 'console' and not api_check():
+            print('hearthpacks.login is no longer the login function')
+            ret = 1
+        if over:
+            ret = 1
+    return ret
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: server.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""Local HearthPwn.com stand-in serving the fixture pages.
+Prints its base URL on the first line of stdout once it is listening.
+
+Usage:
+  server.py [--port PORT] [--latency SECONDS] [--jitter SECONDS]
+            [--error-rate RATE] [--seed NUMBER]
+
+Options:
+  -p PORT, --port=PORT                  Port to listen on, 0 picks a free one
+                                        [default: 0]
+  -l SECONDS, --latency=SECONDS         Delay added to every response
+                                        [default: 0]
+  -j SECONDS, --jitter=SECONDS          Random extra delay, up to SECONDS
+                                        [default: 0]
+  -e RATE, --error-rate=RATE            Probability of answering a simulator
+                                        or save request with a 503
+                                        [default: 0]
+  -s NUMBER, --seed=NUMBER              Seed of the random generator
+"""
+
+from __future__ import print_function, absolute_import
+
+import os
+import re
+import sys
+import time
+import random
+import hashlib
+import threading
+import importlib
+from docopt import docopt
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SIMULATORS = {
+    '1': 'simulator-wild.html',
+    '7': 'simulator-jtu.html',
+    '8': 'simulator-koft.html',
+}
+MEDIA_URL = b'http://media-hearth.cursecdn.com'
+SCORE_RE = re.compile(br'data-score="\d+"')
+USER_ID = 424242
+IMAGE_SIZES = {'png': 48 * 1024, 'gif': 512 * 1024}
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, body, status=200, content_type='text/html; charset=utf-8', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def delay(self, route, faulty=False):
+        standin = self.server.standin
+        standin.count(self.command, route)
+        time.sleep(standin.latency + standin.random.uniform(0, standin.jitter))
+        if faulty and standin.random.random() < standin.error_rate:
+            self.send(b'Service Unavailable', 503)
+            return True
+        return False
+
+    def do_GET(self):
+        standin = self.server.standin
+        path = self.path.split('?')[0]
+        if path == '/login':
+            self.delay('login')
+            if 'User.ID=%s' % (USER_ID) in (self.headers.get('Cookie') or ''):
+                self.send(b'', 302, headers=[('Location', '/')])
+            else:
+                self.send(standin.login_page)
+        elif path.startswith('/packs/simulator/'):
+            if self.delay('simulator', faulty=True):
+                return
+            page = standin.simulators.get(path.rsplit('/', 1)[1])
+            if page is None:
+                self.send(b'Not Found', 404)
+                return
+            score = standin.random.randint(1, 100000)
+            self.send(SCORE_RE.sub(b'data-score="%d"' % score, page, count=1))
+        elif path.startswith('/avatars/'):
+            self.delay('image')
+            extension = path.rsplit('.', 1)[-1]
+            if extension not in IMAGE_SIZES:
+                self.send(b'Not Found', 404)
+                return
+            self.send(standin.image(path, extension), content_type='image/%s' % (extension))
+        else:
+            self.delay('other')
+            self.send(b'Not Found', 404)
+
+    def do_POST(self):
+        standin = self.server.standin
+        path = self.path.split('?')[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+        if path == '/login':
+            self.delay('login')
+            if params.get('loginFormPassword') == 'invalid':
+                self.send(standin.login_failed_page)
+            else:
+                self.send(b'<html><body>Welcome</body></html>', headers=[
+                    ('Set-Cookie', 'User.ID=%s; Path=/' % (USER_ID)),
+                    ('Set-Cookie', 'User.Username=%s; Path=/' % (params.get('username', 'bench'))),
+                ])
+        elif path == '/packs/save':
+            if self.delay('save', faulty=True):
+                return
+            self.send(b'<html><body>Pack saved</body></html>')
+        else:
+            self.delay('other')
+            self.send(b'Not Found', 404)
+
+
+class StandInServer(object):
+    """HearthPwn.com stand-in, serving the fixture pages on a local port
+from a background thread, with configurable latency and error injection."""
+    def __init__(self, port=0, latency=0, jitter=0, error_rate=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.hits = {}
+        self.lock = threading.Lock()
+        self.images = {}
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+        self.httpd.standin = self
+        self.url = 'http://127.0.0.1:%d' % (self.httpd.server_address[1])
+        self.login_page = fixture('login.html')
+        self.login_failed_page = fixture('login-failed.html')
+        self.simulators = dict((n, fixture(name).replace(MEDIA_URL, self.url.encode('ascii')))
+                               for n, name in SIMULATORS.items())
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    def count(self, method, route):
+        with self.lock:
+            self.hits[(method, route)] = self.hits.get((method, route), 0) + 1
+
+    def image(self, path, extension):
+        with self.lock:
+            if path not in self.images:
+                digest = hashlib.sha256(path.encode('utf-8')).digest()
+                self.images[path] = (digest * (IMAGE_SIZES[extension] // len(digest)))
+            return self.images[path]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def rebase(self):
+        """Point the hearthpacks endpoints at this server."""
+        rebase(self.url)
+
+
+def rebase(url):
+    """Point the hearthpacks endpoints at a stand-in server."""
+    login = importlib.import_module('hearthpacks.login')
+    packs = importlib.import_module('hearthpacks.packs')
+    login.LOGIN_FRONTPOINT = url + '/login'
+    login.LOGIN_ENDPOINT = url + '/login'
+    for pack_type, frontpoint in packs.PACKS_FRONTPOINT.items():
+        packs.PACKS_FRONTPOINT[pack_type] = url + '/packs/simulator/' + frontpoint.rsplit('/', 1)[1]
+    packs.PACKS_ENDPOINT = url + '/packs/save'
+
+
+def main():
+    opts = docopt(__doc__)
+    server = StandInServer(port=int(opts['--port']),
+                           latency=float(opts['--latency']),
+                           jitter=float(opts['--jitter']),
+                           error_rate=float(opts['--error-rate']),
+                           seed=opts['--seed'])
+    print(server.url)
+    sys.stdout.flush()
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: aio.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import
+
+import sys
+import time
+import asyncio
+from urllib.parse import urlencode
+try:
+    from http.cookies import SimpleCookie
+    import aiohttp
+except ImportError:
+    raise SystemExit("aiohttp not found. Unable to use the asyncio backend.")
+
+from hearthpacks.login import login, LoginError
+from hearthpacks.packs import PackOpener, PackError
+from hearthpacks.console import Console, parser_pool
+from hearthpacks import packs
+from hearthpacks import metrics
+from hearthpacks.packs import Pack
+from hearthpacks.parser import parse_pack, PackParser
+from hearthpacks.utils import InterruptedHandlerGenerator
+from hearthpacks.transport import endpoint, headers_size, BACKOFF_FACTOR
+
+TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+def client_headers(session):
+    """Returns the headers of a requests.Session object for aiohttp,
+which negotiates the content encodings it can decode by itself."""
+    headers = dict(session.headers)
+    headers.pop('Accept-Encoding', None)
+    return headers
+
+def session_cookies(session):
+    """Convert the cookies of a requests.Session object for aiohttp."""
+    cookies = SimpleCookie()
+    for cookie in session.cookies:
+        cookies[cookie.name] = cookie.value
+        cookies[cookie.name]['domain'] = cookie.domain
+        cookies[cookie.name]['path'] = cookie.path
+    return cookies
+
+
+def account_reply(r, decoded, body=b'', wire=None):
+    """Count the exchange of r in the metrics like transport.account_read,
+decoded being the number of bytes of its body read once decoded and body
+the request body. Unless given, the bytes of the body on the wire are taken
+from its Content-Length, aiohttp decoding it on the fly."""
+    info = r.request_info
+    sent = (len(info.method) + len(info.url.raw_path_qs) + 11 +
+            headers_size(info.headers) + len(body))
+    if wire is None:
+        wire = r.content_length if r.content_length is not None else decoded
+    received = len(r.reason or '') + 15 + headers_size(r.headers) + wire
+    metrics.account(endpoint(str(info.url)), sent, received, decoded,
+                    r.headers.get('Content-Encoding', 'identity') != 'identity',
+                    r.status == 304)
+
+
+class AsyncSubmissionQueue(object):
+    """Save packs from tasks on the event loop, like SubmissionQueue does
+from threads, so that openings never wait for a submission. Failed
+submissions are retried --retries times with an exponential backoff, then
+reported and given up."""
+    def __init__(self, pack_opener):
+        self.pack_opener = pack_opener
+        self.tries = pack_opener.opts['--retries'] + 1
+        self.tasks = set()
+        self.failed = 0
+
+    def put(self, title, pack):
+        task = asyncio.ensure_future(self.save(title, pack))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def save(self, title, pack):
+        delay = BACKOFF_FACTOR
+        for attempt in range(self.tries):
+            try:
+                await self.pack_opener.save_pack(title, pack)
+                return
+            except PackError as e:
+                error = e
+            except Exception as e:
+                error = e
+                break
+            if attempt + 1 < self.tries:
+                await asyncio.sleep(delay)
+                delay *= 2
+        self.failed += 1
+        print('%s: %s' % (error, title), file=sys.stderr)
+
+    async def close(self):
+        """Wait until every pending pack has been submitted or given up."""
+        while self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+
+class AsyncPackOpener(PackOpener):
+    """PackOpener whose opening and saving are coroutines sharing an
+aiohttp.ClientSession, pages being parsed in the loop default executor.
+Threshold packs are saved through an AsyncSubmissionQueue."""
+    def __init__(self, opts, session, client, journal=None):
+        PackOpener.__init__(self, opts, session, journal)
+        self.client = client
+        self.submissions = AsyncSubmissionQueue(self)
+
+    async def open_pack(self):
+        """Open a pack from HearthPwn.com.
+Raise a PackError if the pack could not be retrieved.
+Returns the Pack object of the opened pack."""
+        start, status = time.time(), None
+        content, record = None, None
+        try:
+            async with self.client.get(packs.PACKS_FRONTPOINT[self.opts['PACK_TYPE']],
+                                       timeout=TIMEOUT) as r:
+                status = r.status
+                if r.status < 400 and self.opts['--stream']:
+                    record, received, skipped = await self.read_streamed(r)
+                else:
+                    content = await r.read()
+                    account_reply(r, len(content))
+                    content = content if r.status < 400 else None
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            content, record = None, None
+        elapsed = time.time() - start
+        metrics.OPEN_SECONDS.observe(elapsed, start)
+        if record is not None:
+            metrics.BYTES_RECEIVED.inc(received)
+            metrics.BYTES_SKIPPED.inc(skipped)
+            if self.opts['--verbose'] >= 2:
+                print('Pack page read: %d bytes, left unread: %d bytes' % (received, skipped))
+        elif content:
+            metrics.BYTES_RECEIVED.inc(len(content))
+        if self.pacer:
+            self.pacer.record(elapsed, status)
+        loop = asyncio.get_event_loop()
+        if record is not None:
+            pack = Pack(record=record)
+        elif self.parsers and content:
+            record = await loop.run_in_executor(self.parsers, parse_pack, content)
+            pack = Pack(record=record)
+        else:
+            pack = await loop.run_in_executor(None, Pack, None, content)
+        with metrics.CHECK_SECONDS.time():
+            submissions = self.consider(pack)
+        for title, submission in submissions:
+            self.submissions.put(title, submission)
+        if metrics.tracer:
+            metrics.tracer.span('pack', start, time.time() - start, uid=pack.uid)
+        return pack
+
+    async def read_streamed(self, r):
+        """Feed the body of a simulator response to a PackParser by chunks
+on the loop, closing the response as soon as the pack is parsed.
+Returns the record of the page, the number of bytes read and the number of
+bytes left unread, only known for responses which are not compressed."""
+        parser = PackParser()
+        received = 0
+        try:
+            async for chunk in r.content.iter_chunked(packs.STREAM_CHUNK):
+                received += len(chunk)
+                parser.feed(chunk)
+                if parser.done:
+                    break
+        finally:
+            r.close()
+        skipped = 0
+        if r.content_length and 'Content-Encoding' not in r.headers:
+            skipped = max(r.content_length - received, 0)
+            account_reply(r, received, wire=received)
+        else:
+            account_reply(r, received)
+        return parser.record, received, skipped
+
+    async def save_pack(self, title=None, pack=None):
+        """Save pack to HearthPwn.com.
+If no pack is provided, use current best pack.
+Raise PackError if the pack is invalid or could not be saved.
+Returns the URL of the saved pack, or None if it was refused."""
+        pack = pack or self.best_pack
+        if pack.score == 0:
+            raise PackError("Invalid pack")
+        params = self.save_params(pack, title)
+        if self.opts['--verbose'] >= 2:
+            print('Save pack request params:')
+            print(params)
+        try:
+            with metrics.SAVE_SECONDS.time():
+                async with self.client.post(packs.PACKS_ENDPOINT, data=params, timeout=TIMEOUT,
+                                            headers={'Referer': packs.PACKS_FRONTPOINT[self.opts['PACK_TYPE']]}) as r:
+                    url = str(r.url) if r.status < 400 else None
+                    account_reply(r, 0, urlencode(params).encode('utf-8'))
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            url = False
+        (metrics.PACKS_SUBMITTED if url else metrics.SAVES_FAILED).inc()
+        if self.journal:
+            self.journal.record_save(pack, params[-1][1], bool(url))
+        if url is False:
+            raise PackError("Unable to submit pack")
+        if url:
+            pack.submitted = True
+            if self.opts['--verbose'] >= 1:
+                print('Save pack url: %s' % (url))
+        else:
+            if self.opts['--verbose'] >= 1:
+                print('Pack could not be saved', file=sys.stderr)
+        return url
+
+
+class AsyncConsole(Console):
+    """Console running every pack opening on a single event loop,
+with up to --workers requests in flight."""
+    async def pause(self):
+        await asyncio.sleep(self.limiter.reserve() if self.limiter
+                            else self.opts['--wait'])
+
+    async def open_packs(self, pack_opener, attempts):
+        async def worker():
+            for i in attempts:
+                if pack_opener.should_stop(self.opts['--attempts'] - i):
+                    attempts.release()
+                    break
+                await pack_opener.open_pack()
+                await self.pause()
+
+        tasks = [asyncio.ensure_future(worker())
+                 for _ in range(self.opts['--workers'])]
+        try:
+            await asyncio.gather(*tasks)
+        except PackError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def main(self, session):
+        ret = 0
+        connector = aiohttp.TCPConnector(limit=self.opts['--workers'])
+        async with aiohttp.ClientSession(connector=connector,
+                                         headers=client_headers(session),
+                                         cookies=session_cookies(session)) as client:
+            pack_opener = self.pack_opener = AsyncPackOpener(self.opts, session, client,
+                                                             self.journal)
+            pack_opener.pacer = self.pacer
+            pack_opener.parsers = self.parsers
+            try:
+                attempts = InterruptedHandlerGenerator(range(self.opts['--attempts']))
+                await self.open_packs(pack_opener, iter(attempts))
+                await pack_opener.submissions.close()
+                if self.opts['--verbose'] >= 1:
+                    print('The best pack is:')
+                    print(pack_opener.best_pack)
+                if pack_opener.best_pack.score > 0:
+                    await pack_opener.save_pack("Best pack")
+                if self.opts['--verbose'] >= 1:
+                    if self.opts['--stream']:
+                        self.print_stream_stats()
+                    print(metrics.bandwidth_summary())
+            except PackError as e:
+                print(e, file=sys.stderr)
+                ret = 3
+                if pack_opener.best_pack.score > 0:
+                    if self.opts['--verbose'] >= 1:
+                        print("Trying to submit best pack before error:")
+                        print(pack_opener.best_pack)
+                    try:
+                        await pack_opener.save_pack("Best pack")
+                    except PackError as e:
+                        print(e, file=sys.stderr)
+            finally:
+                await pack_opener.submissions.close()
+        return ret
+
+    def run(self):
+        if not self.start_metrics():
+            return 1
+        if not self.open_journal():
+            self.stop_metrics()
+            return 1
+        try:
+            session = login(self.opts)
+        except LoginError as e:
+            print(e, file=sys.stderr)
+            if self.journal:
+                self.journal.close()
+            self.stop_metrics()
+            return 2
+        self.parsers = parser_pool(self.opts)
+        try:
+            return asyncio.run(self.main(session))
+        finally:
+            if self.journal:
+                self.journal.close()
+            if self.parsers:
+                self.parsers.shutdown()
+            self.stop_metrics()
@@ -9,29 +9,187 @@
 from __future__ import print_function, absolute_import
 
 import sys
-import time
+import threading
+import multiprocessing
 from retry import retry
-from hearthpacks import login, LoginError
-from hearthpacks import PackOpener, PackError
-from hearthpacks.utils import InterruptedHandlerGenerator
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from hearthpacks.login import login, LoginError
+from hearthpacks.packs import PackOpener, PackError
+from hearthpacks import images
+from hearthpacks import metrics
+from hearthpacks.journal import Journal
+from hearthpacks.submit import SubmissionQueue
+from hearthpacks.packs import PACKS_FRONTPOINT
+from hearthpacks.transport import preconnect, idle, connection_stats
+from hearthpacks.pacing import Pacer
+from hearthpacks.utils import InterruptedHandlerGenerator, TokenBucket
+
+TICKET_TIMEOUT = 0.5
+
+def parser_pool(opts):
+    """Returns a pool of --parse-processes processes parsing pack pages,
+or None if parsing is done by the opening threads. Its processes are
+spawned right away, before the opening threads are started."""
+    if not opts['--parse-processes']:
+        return None
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        raise SystemExit("futures not found. Unable to use --parse-processes.")
+    if sys.version_info >= (3, 7):
+        pool = ProcessPoolExecutor(opts['--parse-processes'],
+                                   mp_context=multiprocessing.get_context('spawn'))
+    else:
+        pool = ProcessPoolExecutor(opts['--parse-processes'])
+    for future in [pool.submit(int) for _ in range(opts['--parse-processes'])]:
+        future.result()
+    return pool
+
 
 class Console(object):
     def __init__(self, opts):
         self.opts = opts
+        self.journal = None
+        self.parsers = None
+        self.pack_opener = None
+        self.pacer = (Pacer(opts['--rate'] or opts['--min-rate'], opts['--min-rate'],
+                            opts['--max-rate'], opts['--workers'], opts['--verbose'])
+                      if opts['--max-rate'] else None)
+        self.limiter = self.pacer or (TokenBucket(opts['--rate'], opts['--workers'])
+                                      if opts['--rate'] else None)
+
+    def pause(self, session):
+        if self.limiter:
+            self.limiter.acquire()
+        else:
+            idle(session, PACKS_FRONTPOINT[self.opts['PACK_TYPE']], self.opts['--wait'])
+
+    def open_packs(self, pack_opener, attempts):
+        """Open packs with --workers threads, the attempts being handed out
+from the calling thread so it keeps handling the interruption signal.
+Raise the first error met by a worker, once every worker has stopped."""
+        tickets = queue.Queue(self.opts['--workers'])
+        errors = []
+
+        def worker():
+            for _ in iter(tickets.get, None):
+                if errors:
+                    continue
+                try:
+                    pack_opener.open_pack()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                self.pause(pack_opener.session)
+
+        def hand_out(ticket):
+            """Returns False if no worker is left to take the ticket."""
+            while True:
+                try:
+                    tickets.put(ticket, timeout=TICKET_TIMEOUT)
+                    return True
+                except queue.Full:
+                    if not any(thread.is_alive() for thread in threads):
+                        return False
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(self.opts['--workers'])]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for i in attempts:
+            if (errors or pack_opener.should_stop(self.opts['--attempts'] - i) or
+                not hand_out(i)):
+                attempts.release()
+                break
+        for thread in threads:
+            if not hand_out(None):
+                break
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def print_stream_stats(self):
+        print('Pack pages streamed: %d bytes read, %d bytes left unread (%d per pack)'
+              % (metrics.BYTES_RECEIVED.value, metrics.BYTES_SKIPPED.value,
+                 metrics.BYTES_SKIPPED.value // max(metrics.PACKS_OPENED.value, 1)))
+
+    def start_metrics(self):
+        """Start the metrics endpoint and the periodic summary if requested.
+Returns False if the endpoint cannot be served."""
+        self.metrics_server = self.reporter = None
+        if self.opts['--metrics-port']:
+            try:
+                self.metrics_server = metrics.serve(self.opts['--metrics-port'])
+            except (IOError, OSError) as e:
+                print('Error: unable to serve the metrics on port %d: %s'
+                      % (self.opts['--metrics-port'], e), file=sys.stderr)
+                return False
+        if self.opts['--metrics-interval']:
+            self.reporter = metrics.Reporter(self.opts['--metrics-interval'])
+        return True
+
+    def open_journal(self):
+        """Open the journal if requested. Returns False if it cannot be written."""
+        if self.opts['--journal']:
+            try:
+                self.journal = Journal(self.opts['--journal'])
+            except (IOError, OSError) as e:
+                print('Error: unable to open the journal in %s: %s'
+                      % (self.opts['--journal'], e), file=sys.stderr)
+                return False
+        return True
+
+    def stop_metrics(self):
+        if self.reporter:
+            self.reporter.stop()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
 
     def run(self):
         ret = 0
+        pack_opener = None
+        if not self.start_metrics():
+            return 1
         try:
+            if not self.open_journal():
+                return 1
             session = login(self.opts)
-            pack_opener = PackOpener(self.opts, session)
-            for i in InterruptedHandlerGenerator(range(self.opts['--attempts'])):
-                pack_opener.open_pack()
-                time.sleep(self.opts['--wait'])
+            images.configure(self.opts, session)
+            preconnect(session, PACKS_FRONTPOINT[self.opts['PACK_TYPE']],
+                       self.opts['--workers'])
+            pack_opener = self.pack_opener = PackOpener(self.opts, session, self.journal)
+            pack_opener.pacer = self.pacer
+            pack_opener.parsers = self.parsers = parser_pool(self.opts)
+            pack_opener.submissions = SubmissionQueue(pack_opener, self.opts['--workers'])
+            attempts = InterruptedHandlerGenerator(range(self.opts['--attempts']))
+            if self.opts['--workers'] > 1:
+                self.open_packs(pack_opener, attempts)
+            else:
+                for i in attempts:
+                    if pack_opener.should_stop(self.opts['--attempts'] - i):
+                        attempts.release()
+                        break
+                    pack_opener.open_pack()
+                    self.pause(session)
+            pack_opener.submissions.close()
             if self.opts['--version'] >= 1:
                 print('The best pack is:')
                 print(pack_opener.best_pack)
             if pack_opener.best_pack.score > 0:
                 pack_opener.save_pack("Best pack")
+            if self.opts['--verbose'] >= 1:
+                print('Scores: median %d, 90th percentile %d, 99th percentile %d'
+                      % tuple(pack_opener.sketch.quantile(q) for q in (0.5, 0.9, 0.99)))
+                print('HTTP requests: %d, new connections: %d' % connection_stats(session))
+                if self.opts['--stream']:
+                    self.print_stream_stats()
+                print(metrics.bandwidth_summary())
         except LoginError as e:
             print(e, file=sys.stderr)
             ret = 2
@@ -45,4 +203,12 @@ class Console(object):
                 @retry(PackError, tries=5, delay=2)
                 def save_pack():
                     pack_opener.save_pack("Best pack")
+        finally:
+            if pack_opener and pack_opener.submissions:
+                pack_opener.submissions.close()
+            if self.journal:
+                self.journal.close()
+            if self.parsers:
+                self.parsers.shutdown()
+            self.stop_metrics()
         return ret
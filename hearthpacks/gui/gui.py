@@ -19,6 +19,7 @@ except ImportError:
     except ImportError:
         raise SystemExit("PyQt5 and PySide not found. Unable to launch GUI.")
 
+from hearthpacks import images
 from hearthpacks.gui.login import LoginWindow
 from hearthpacks.gui.packs import PackOpenerWindow
 
@@ -41,6 +42,7 @@ class Gui(QApplication):
     @pyqtSlot(requests.Session)
     def loginDone(self, session):
         self.loginWindow.hide()
+        images.configure(self.opts, session)
         self.packWindow = PackOpenerWindow(self.opts, session)
         self.packWindow.logout.connect(self.reinitUI)
         self.packWindow.show()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: histogram.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, division
+
+try:
+    from PyQt5.QtCore import Qt, QRect
+    from PyQt5.QtGui import QPainter, QColor
+    from PyQt5.QtWidgets import QWidget, QSizePolicy
+except ImportError:
+    try:
+        from PySide.QtCore import Qt, QRect
+        from PySide.QtGui import QPainter, QColor
+        from PySide.QtGui import QWidget, QSizePolicy
+    except ImportError:
+        raise SystemExit("PyQt5 and PySide not found. Unable to launch GUI.")
+
+from hearthpacks.sketch import ScoreSketch
+
+GROWTH = 1.25
+MARGIN = 15
+
+class ScoreHistogram(QWidget):
+    """Distribution of the scores of the packs opened, in logarithmic
+buckets. Scores are added a tick at a time, only the bars they change being
+repainted unless the scale changes."""
+    def __init__(self, parent=None):
+        QWidget.__init__(self, parent)
+        self.sketch = ScoreSketch(GROWTH)
+        self.low, self.high = 0, -1
+        self.top = 0
+        self.setMinimumHeight(100)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
+    def clear(self):
+        self.sketch = ScoreSketch(GROWTH)
+        self.low, self.high = 0, -1
+        self.top = 0
+        self.update()
+
+    def add(self, scores):
+        """Account for the scores opened during a tick."""
+        if not scores:
+            return
+        changed = set()
+        for score in scores:
+            self.sketch.add(score)
+            changed.add(self.sketch.index(score))
+        low, high = min(self.sketch.buckets), max(self.sketch.buckets)
+        top = max(self.sketch.buckets[index] for index in changed)
+        if (low, high) != (self.low, self.high) or top > self.top:
+            self.low, self.high = low, high
+            self.top = max(self.top, top)
+            self.update()
+        else:
+            self.update(QRect(0, 0, self.width(), MARGIN))
+            for index in changed:
+                bar = self.bar(index)
+                self.update(QRect(bar.left(), 0, bar.width(), self.height()))
+
+    def bar(self, index):
+        """Returns the rectangle of the bar of a bucket."""
+        count = self.high - self.low + 1
+        width = (self.width() - 2 * MARGIN) / count
+        height = self.height() - 2 * MARGIN
+        value = self.sketch.buckets.get(index, 0)
+        bar_height = int(height * value / self.top) if self.top else 0
+        left = int(MARGIN + (index - self.low) * width)
+        return QRect(left, MARGIN + height - bar_height,
+                     max(int(MARGIN + (index - self.low + 1) * width) - left - 1, 1),
+                     bar_height)
+
+    def paintEvent(self, event):
+        painter = QPainter()
+        painter.begin(self)
+        painter.fillRect(event.rect(), self.palette().window())
+        if self.sketch.count:
+            for index in range(self.low, self.high + 1):
+                rect = self.bar(index)
+                if rect.height() and rect.intersects(event.rect()):
+                    painter.fillRect(rect, QColor(70, 130, 180))
+            painter.setPen(self.palette().windowText().color())
+            painter.drawText(QRect(MARGIN, self.height() - MARGIN, self.width() - 2 * MARGIN, MARGIN),
+                             Qt.AlignLeft, '%d' % (self.sketch.min))
+            painter.drawText(QRect(MARGIN, self.height() - MARGIN, self.width() - 2 * MARGIN, MARGIN),
+                             Qt.AlignRight, '%d' % (self.sketch.max))
+            painter.drawText(QRect(MARGIN, 0, self.width() - 2 * MARGIN, MARGIN),
+                             Qt.AlignLeft, '%d packs' % (self.sketch.count))
+        painter.end()
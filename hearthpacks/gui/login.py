@@ -28,7 +28,7 @@ except ImportError:
     except ImportError:
         raise SystemExit("PyQt5 and PySide not found. Unable to launch GUI.")
 
-from hearthpacks import login, LoginError
+from hearthpacks.login import login, LoginError
 from hearthpacks.gui.menu import MenuWindow, LoadingOverlay
 
 class LoginWidget(QWidget):
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: network.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, division
+
+import time
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+try:
+    from PyQt5 import QtCore
+    from PyQt5.QtCore import pyqtSignal, pyqtSlot
+    from PyQt5.QtNetwork import (QNetworkAccessManager, QNetworkRequest,
+                                 QNetworkCookieJar, QNetworkCookie)
+except ImportError:
+    try:
+        from PySide import QtCore
+        from PySide.QtCore import Signal as pyqtSignal
+        from PySide.QtCore import Slot as pyqtSlot
+        from PySide.QtNetwork import (QNetworkAccessManager, QNetworkRequest,
+                                      QNetworkCookieJar, QNetworkCookie)
+    except ImportError:
+        raise SystemExit("PyQt5 and PySide not found. Unable to launch GUI.")
+
+from hearthpacks import packs
+from hearthpacks import metrics
+from hearthpacks.packs import Pack, PackError
+
+TIMEOUT = 5000
+
+def make_manager(session, parent=None):
+    """Returns a QNetworkAccessManager sharing the cookies of the
+requests.Session object retrieved from login."""
+    manager = QNetworkAccessManager(parent)
+    jar = QNetworkCookieJar(manager)
+    cookies = []
+    for cookie in session.cookies:
+        qcookie = QNetworkCookie(cookie.name.encode('utf-8'), cookie.value.encode('utf-8'))
+        qcookie.setDomain(cookie.domain)
+        qcookie.setPath(cookie.path)
+        qcookie.setSecure(bool(cookie.secure))
+        cookies.append(qcookie)
+    jar.setAllCookies(cookies)
+    manager.setCookieJar(jar)
+    return manager
+
+def make_request(session, url, headers=None):
+    """Returns a QNetworkRequest for url with the headers of the session,
+following redirections where Qt supports it."""
+    request = QNetworkRequest(QtCore.QUrl(url))
+    for name, value in dict(session.headers, **(headers or {})).items():
+        request.setRawHeader(name.encode('ascii'), value.encode('utf-8'))
+    if hasattr(QNetworkRequest, 'FollowRedirectsAttribute'):
+        request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
+    if hasattr(request, 'setTransferTimeout'):
+        request.setTransferTimeout(TIMEOUT)
+    return request
+
+def reply_status(reply):
+    """Returns the HTTP status of a finished reply, or None if no response
+was received."""
+    status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    return int(status) if status is not None else None
+
+
+def reply_headers(reply, names):
+    """Returns a dict of the headers of reply among names."""
+    return dict((name, bytes(reply.rawHeader(name.encode('ascii'))).decode('latin-1'))
+                for name in names if reply.hasRawHeader(name.encode('ascii')))
+
+
+class ParseSignals(QtCore.QObject):
+    parsed = pyqtSignal(int, object)
+
+
+class ParseTask(QtCore.QRunnable):
+    """Build a Pack from a simulator page on the global thread pool,
+emitting it along with the generation of its run through signals, a
+QObject living in the GUI thread."""
+    def __init__(self, content, generation, signals):
+        QtCore.QRunnable.__init__(self)
+        self.content = content
+        self.generation = generation
+        self.signals = signals
+
+    def run(self):
+        self.signals.parsed.emit(self.generation, Pack(content=self.content))
+
+
+class NetworkPackOpener(QtCore.QObject):
+    """Open packs with Qt asynchronous networking from the GUI thread.
+Up to --workers simulator requests are in flight, each slot waiting --wait
+seconds, or for the pacer, between two requests. Pages are parsed on the
+global thread pool and submissions are posted without blocking openings.
+The thresholds, the journal and the sketches are handled by the PackOpener
+given to open_packs. Replies are handled by slots looking up what they
+belong to, so that no closure keeps a reply alive. Replies to a run stopped
+before they came back are only waited for, not opened."""
+    opened = pyqtSignal(Pack)
+    submitted = pyqtSignal(Pack)
+    failed = pyqtSignal(PackError)
+    done = pyqtSignal()
+
+    def __init__(self, session, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.session = session
+        self.manager = make_manager(session, self)
+        self.pack_opener = None
+        self.running = False
+        self.generation = 0
+        self.started = 0
+        self.pending = 0
+        self.fetching = {}
+        self.saving = {}
+        self.parser = ParseSignals(self)
+        self.parser.parsed.connect(self.parsed)
+
+    def open_packs(self, pack_opener):
+        self.pack_opener = pack_opener
+        self.running = True
+        self.generation += 1
+        self.started = 0
+        for i in range(pack_opener.opts['--workers']):
+            self.fetch(self.generation)
+
+    def stop(self):
+        self.running = False
+        self.finish()
+
+    def finish(self):
+        if not self.pending and self.pack_opener:
+            self.pack_opener = None
+            self.done.emit()
+
+    def schedule(self):
+        """Start the next request of a slot once its pause is over."""
+        if self.pack_opener.pacer:
+            delay = self.pack_opener.pacer.reserve()
+        else:
+            delay = self.pack_opener.opts['--wait']
+        generation = self.generation
+        QtCore.QTimer.singleShot(int(delay * 1000), lambda: self.fetch(generation))
+
+    def fetch(self, generation):
+        """Start a simulator request, unless the run is over or generation
+belongs to a previous run."""
+        if generation != self.generation:
+            return
+        pack_opener = self.pack_opener
+        attempts = pack_opener.opts['--attempts'] if pack_opener else 0
+        if (not self.running or self.started >= attempts or
+            pack_opener.should_stop(attempts - self.started)):
+            self.running = False
+            self.finish()
+            return
+        self.started += 1
+        self.pending += 1
+        url = packs.PACKS_FRONTPOINT[pack_opener.opts['PACK_TYPE']]
+        reply = self.manager.get(make_request(self.session, url))
+        self.fetching[reply] = (time.time(), generation)
+        reply.finished.connect(self.fetched)
+
+    @pyqtSlot()
+    def fetched(self):
+        reply = self.sender()
+        start, generation = self.fetching.pop(reply)
+        elapsed = time.time() - start
+        status = reply_status(reply)
+        content = reply.readAll().data() if status is not None and status < 400 else None
+        reply.deleteLater()
+        metrics.OPEN_SECONDS.observe(elapsed, start)
+        if content:
+            metrics.BYTES_RECEIVED.inc(len(content))
+        if (generation == self.generation and self.pack_opener and
+            self.pack_opener.pacer):
+            self.pack_opener.pacer.record(elapsed, status)
+        QtCore.QThreadPool.globalInstance().start(ParseTask(content, generation,
+                                                            self.parser))
+
+    @pyqtSlot(int, object)
+    def parsed(self, generation, pack):
+        self.pending -= 1
+        pack_opener = self.pack_opener
+        if pack_opener is None:
+            return
+        if generation != self.generation:
+            if not self.running:
+                self.finish()
+            return
+        try:
+            with metrics.CHECK_SECONDS.time():
+                submissions = pack_opener.consider(pack)
+        except PackError as e:
+            self.running = False
+            self.failed.emit(e)
+            self.finish()
+            return
+        self.opened.emit(pack)
+        for title, submission in submissions:
+            self.save_pack(title, submission)
+        if self.running:
+            self.schedule()
+        else:
+            self.finish()
+
+    def save_pack(self, title, pack):
+        pack_opener = self.pack_opener
+        params = pack_opener.save_params(pack, title)
+        request = make_request(self.session, packs.PACKS_ENDPOINT,
+                               {'Referer': packs.PACKS_FRONTPOINT[pack_opener.opts['PACK_TYPE']],
+                                'Content-Type': 'application/x-www-form-urlencoded'})
+        body = urlencode([(key.encode('utf-8'), value.encode('utf-8'))
+                          for key, value in params]).encode('ascii')
+        reply = self.manager.post(request, body)
+        self.saving[reply] = (time.time(), pack_opener, pack, params[-1][1])
+        reply.finished.connect(self.saved)
+
+    @pyqtSlot()
+    def saved(self):
+        reply = self.sender()
+        start, pack_opener, pack, title = self.saving.pop(reply)
+        metrics.SAVE_SECONDS.observe(time.time() - start, start)
+        status = reply_status(reply)
+        reply.deleteLater()
+        ok = status is not None and status < 400
+        (metrics.PACKS_SUBMITTED if ok else metrics.SAVES_FAILED).inc()
+        if pack_opener.journal:
+            pack_opener.journal.record_save(pack, title, ok)
+        if ok:
+            pack.submitted = True
+            self.submitted.emit(pack)
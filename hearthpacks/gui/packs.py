@@ -8,11 +8,12 @@
 
 from __future__ import absolute_import
 
-import shutil
-import tempfile
+import time
+from collections import OrderedDict, deque
 try:
     from PyQt5 import QtCore, QtGui
     from PyQt5.QtCore import pyqtSignal, pyqtSlot
+    from PyQt5.QtNetwork import QNetworkRequest
     from PyQt5.QtWidgets import (QWidget, QAction, QSizePolicy,
                                  QHBoxLayout, QVBoxLayout, QGridLayout,
                                  QLabel, QLineEdit, QPushButton,
@@ -22,6 +23,7 @@ except ImportError:
         from PySide import QtCore, QtGui
         from PySide.QtCore import Signal as pyqtSignal
         from PySide.QtCore import Slot as pyqtSlot
+        from PySide.QtNetwork import QNetworkRequest
         from PySide.QtGui import (QWidget, QAction, QSizePolicy,
                                   QHBoxLayout, QVBoxLayout, QGridLayout,
                                   QLabel, QLineEdit, QPushButton,
@@ -29,28 +31,54 @@ except ImportError:
     except ImportError:
         raise SystemExit("PyQt5 and PySide not found. Unable to launch GUI.")
 
-from hearthpacks import PackOpener, PackError
-from hearthpacks.packs import Pack, Card
+from hearthpacks.packs import PackOpener, PackError
+from hearthpacks import images, metrics
+from hearthpacks.packs import Pack
 from hearthpacks.packs import PACKS_TYPE
+from hearthpacks.journal import Journal
+from hearthpacks.pacing import Pacer
 from hearthpacks.gui.menu import MenuWindow, LoadingOverlay
+from hearthpacks.gui.network import NetworkPackOpener, reply_status, reply_headers
+from hearthpacks.gui.histogram import ScoreHistogram
+
+REFRESH_INTERVAL = 250
+RATE_WINDOW = 5
 
 class PackOpenerWidget(QWidget):
     def __init__(self, opts, session, parent=None):
         QWidget.__init__(self, parent)
         self.opts = opts
         self.session = session
+        self.journal = None
+        if opts['--journal']:
+            try:
+                self.journal = Journal(opts['--journal'])
+            except (IOError, OSError) as e:
+                QMessageBox.critical(self, "Error",
+                                     "Unable to open the journal in %s, packs will not "
+                                     "be recorded: %s" % (opts['--journal'], e))
+        self.sketches = {}
         self.count = 0
+        self.last_score = None
+        self.best_score = 0
+        self.tick_scores = []
+        self.ticks = deque()
         self.initThread()
         self.initUI()
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setInterval(REFRESH_INTERVAL)
+        self.refreshTimer.timeout.connect(self.refresh)
 
     def initThread(self):
-        self.packOpenerThread = PackOpenerThread()
-        self.packOpenerThread.submitted.connect(self.pack_submitted)
-        self.packOpenerThread.opened.connect(self.pack_opened)
-        self.packOpenerThread.failed.connect(self.pack_failed)
-        self.packOpenerThread.done.connect(self.stop)
-        self.imageLoaderPool = ImageLoaderTaskerPool()
+        self.networkPackOpener = NetworkPackOpener(self.session, self)
+        self.networkPackOpener.submitted.connect(self.pack_submitted)
+        self.networkPackOpener.opened.connect(self.pack_opened)
+        self.networkPackOpener.failed.connect(self.pack_failed)
+        self.networkPackOpener.done.connect(self.stop)
+        self.imageLoaderPool = ImageLoaderTaskerPool(self.networkPackOpener.manager)
         self.imageLoaderPool.done.connect(self.images_loaded)
+        self.scaledImages = ScaledImages()
+        self.scaledImages.scaled.connect(self.image_scaled)
 
     def initUI(self):
         attemptsLabel = QLabel('Attempts', self)
@@ -138,6 +166,24 @@ class PackOpenerWidget(QWidget):
         counterGroup.addWidget(counterTextLabel)
         counterGroup.addWidget(self.counterLabel)
 
+        rateTextLabel = QLabel('Packs/s:', self)
+        self.rateLabel = QLabel('-', self)
+        lastScoreTextLabel = QLabel('Last score:', self)
+        self.lastScoreLabel = QLabel('-', self)
+        bestScoreTextLabel = QLabel('Best score:', self)
+        self.bestScoreLabel = QLabel('-', self)
+        statsGroup = QHBoxLayout()
+        statsGroup.setAlignment(QtCore.Qt.AlignCenter)
+        statsGroup.setSpacing(1)
+        statsGroup.addWidget(rateTextLabel)
+        statsGroup.addWidget(self.rateLabel)
+        statsGroup.addSpacing(20)
+        statsGroup.addWidget(lastScoreTextLabel)
+        statsGroup.addWidget(self.lastScoreLabel)
+        statsGroup.addSpacing(20)
+        statsGroup.addWidget(bestScoreTextLabel)
+        statsGroup.addWidget(self.bestScoreLabel)
+
         packScoreTextLabel = QLabel('Pack score:', self)
         self.packScoreLabel = QLabel('-', self)
         packScoreGroup = QHBoxLayout()
@@ -148,12 +194,16 @@ class PackOpenerWidget(QWidget):
 
         botScreen = QGridLayout()
         botScreen.addLayout(counterGroup, 0, 0, alignment=QtCore.Qt.AlignLeft)
-        botScreen.addLayout(packScoreGroup, 0, 1, alignment=QtCore.Qt.AlignRight)
+        botScreen.addLayout(statsGroup, 0, 1, alignment=QtCore.Qt.AlignCenter)
+        botScreen.addLayout(packScoreGroup, 0, 2, alignment=QtCore.Qt.AlignRight)
+
+        self.histogram = ScoreHistogram(self)
 
         grid = QGridLayout()
         grid.addLayout(topScreen, 0, 0, alignment=QtCore.Qt.AlignTop)
         grid.addLayout(midScreen, 1, 0, alignment=QtCore.Qt.AlignCenter)
-        grid.addLayout(botScreen, 2, 0, alignment=QtCore.Qt.AlignBottom)
+        grid.addWidget(self.histogram, 2, 0)
+        grid.addLayout(botScreen, 3, 0, alignment=QtCore.Qt.AlignBottom)
         self.setLayout(grid)
 
     @pyqtSlot()
@@ -165,13 +215,25 @@ class PackOpenerWidget(QWidget):
         self.lowThresholdSpin.setEnabled(False)
         self.packTypeCombobox.setEnabled(False)
         self.count = 0
+        self.last_score = None
+        self.best_score = 0
+        self.tick_scores = []
+        self.ticks.clear()
+        self.ticks.append((time.time(), 0))
+        self.histogram.clear()
+        self.refresh()
+        self.refreshTimer.start()
         opts = dict(self.opts, **{
             '--attempts': self.attemptsSpin.value(),
             '--threshold': self.highThresholdSpin.value(),
             '--low-threshold': self.lowThresholdSpin.value(),
             'PACK_TYPE': self.packTypeCombobox.currentText(),
         })
-        self.packOpenerThread.open_packs(PackOpener(opts, self.session))
+        pack_opener = PackOpener(opts, self.session, self.journal, self.sketches)
+        if opts['--max-rate']:
+            pack_opener.pacer = Pacer(opts['--rate'] or opts['--min-rate'], opts['--min-rate'],
+                                      opts['--max-rate'])
+        self.networkPackOpener.open_packs(pack_opener)
 
     @pyqtSlot()
     def stop(self):
@@ -181,12 +243,35 @@ class PackOpenerWidget(QWidget):
         self.highThresholdSpin.setEnabled(True)
         self.lowThresholdSpin.setEnabled(True)
         self.packTypeCombobox.setEnabled(True)
-        self.packOpenerThread.stop()
+        self.networkPackOpener.stop()
+        self.refreshTimer.stop()
+        self.refresh()
 
-    @pyqtSlot()
-    def pack_opened(self):
+    @pyqtSlot(Pack)
+    def pack_opened(self, pack):
         self.count += 1
+        self.last_score = pack.score
+        self.best_score = max(self.best_score, pack.score)
+        self.tick_scores.append(pack.score)
+
+    @pyqtSlot()
+    def refresh(self):
+        """Show the packs opened since the last refresh, every REFRESH_INTERVAL
+milliseconds while opening, the opening rate being averaged over the last
+RATE_WINDOW seconds."""
+        now = time.time()
+        self.ticks.append((now, self.count))
+        while len(self.ticks) > 2 and now - self.ticks[0][0] > RATE_WINDOW:
+            self.ticks.popleft()
+        start, count = self.ticks[0]
         self.counterLabel.setText(str(self.count))
+        if now > start:
+            self.rateLabel.setText('%.1f' % ((self.count - count) / (now - start)))
+        if self.last_score is not None:
+            self.lastScoreLabel.setText(str(self.last_score))
+            self.bestScoreLabel.setText(str(self.best_score))
+        self.histogram.add(self.tick_scores)
+        self.tick_scores = []
 
     @pyqtSlot(Pack)
     def pack_submitted(self, pack):
@@ -201,27 +286,42 @@ class PackOpenerWidget(QWidget):
     @pyqtSlot(list)
     def images_loaded(self, result):
         self.midLabel.setText("Last submitted pack:")
-        for (card, filename), label in zip(result, self.cardLabels):
+        for (card, image), label in zip(result, self.cardLabels):
             label.card = card
-            if card.golden:
-                res = QtGui.QMovie(filename)
-                label.card_data = res
-                label.setMovie(res)
-                res.start()
+            label.card_data = image
+            if image is None:
+                label.setText(card.name)
+            elif card.golden:
+                label.setMovie(image)
+                image.start()
             else:
-                res = QtGui.QPixmap(filename)
-                label.card_data = res
-                label.setPixmap(res)
+                self.show_scaled(label, QtCore.QSize(card.width, card.height))
             label.show()
 
+    def show_scaled(self, label, size=None):
+        """Show the card image of label at size, the size of label by
+default, or the closest size available while it is being scaled. A new
+card is shown at the size of its image on the page, the label being laid
+out from its pixmap."""
+        pixmap = self.scaledImages.get(label.card, label.card_data, size or label.size())
+        if pixmap is not None:
+            label.setPixmap(pixmap)
+
+    @pyqtSlot(tuple, QtCore.QSize)
+    def image_scaled(self, key, size):
+        for label in self.cardLabels:
+            card = getattr(label, 'card', None)
+            if (card is not None and not card.golden and label.card_data is not None and
+                ImageLoaderTaskerPool.key(card) == key and label.size() == size):
+                self.show_scaled(label)
+
     def eventFilter(self, source, event):
-        if (source in self.cardLabels and event.type() == QtCore.QEvent.Resize):
+        if (source in self.cardLabels and event.type() == QtCore.QEvent.Resize and
+            getattr(source, 'card_data', None) is not None):
             if source.card.golden:
                 source.card_data.setScaledSize(source.size())
             else:
-                source.setPixmap(source.card_data.scaled(source.size(),
-                                                         QtCore.Qt.KeepAspectRatio,
-                                                         QtCore.Qt.SmoothTransformation))
+                self.show_scaled(source)
         return QWidget.eventFilter(self, source, event)
 
 class PackOpenerWindow(MenuWindow):
@@ -235,7 +335,7 @@ class PackOpenerWindow(MenuWindow):
 
     def initUI(self):
         MenuWindow.initUI(self)
-        self.setFixedSize(1400, 550)
+        self.setFixedSize(1400, 650)
 
     def initMenus(self):
         logoutAction = QAction('&Logout', self)
@@ -251,95 +351,238 @@ class PackOpenerWindow(MenuWindow):
         self.logout.emit()
 
 
-class PackOpenerThread(QtCore.QThread):
-    opened = pyqtSignal()
-    submitted = pyqtSignal(Pack)
-    failed = pyqtSignal(PackError)
-    done = pyqtSignal()
+class DecodedImages(object):
+    """Decoded card images keyed by (card_id, golden), evicting the least
+recently used ones once they hold more than max_size bytes."""
+    def __init__(self, max_size=64 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.images = OrderedDict()
 
-    def __init__(self):
-        QtCore.QThread.__init__(self)
-        self.mutex = QtCore.QMutex()
-        self.pack_opener = None
-        self._isRunning = False
+    def get(self, key):
+        entry = self.images.pop(key, None)
+        if entry is None:
+            return None
+        self.images[key] = entry
+        return entry[0]
 
-    def open_packs(self, pack_opener):
-        locker = QtCore.QMutexLocker(self.mutex)
-        self._isRunning = True
-        self.pack_opener = pack_opener
-        if not self.isRunning():
-            self.start()
+    def __contains__(self, key):
+        return key in self.images
 
-    def stop(self):
-        self._isRunning = False
+    def put(self, key, image, size):
+        old = self.images.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self.images[key] = (image, size)
+        self.size += size
+        while self.size > self.max_size and len(self.images) > 1:
+            _, (_, size) = self.images.popitem(last=False)
+            self.size -= size
 
-    def run(self):
-        if not self.pack_opener:
-            return
-        try:
-            for i in range(self.pack_opener.opts['--attempts']):
-                if not self._isRunning:
-                    break
-                self.mutex.lock()
-                pack = self.pack_opener.open_pack()
-                self.mutex.unlock()
-                self.opened.emit()
-                if pack.submitted:
-                    self.submitted.emit(pack)
-                self.sleep(self.pack_opener.opts['--wait'])
-        except PackError as e:
-            self.failed.emit(e)
-        finally:
-            self.mutex.unlock()
-            self.done.emit()
-
-
-class ImageLoaderSignals(QtCore.QObject):
-    done = pyqtSignal(Card, object)
-
-
-class ImageLoaderWorker(QtCore.QRunnable):
-    def __init__(self, card):
+
+class ScaleSignals(QtCore.QObject):
+    scaled = pyqtSignal(tuple, QtCore.QSize, QtGui.QImage)
+
+
+class ScaleTask(QtCore.QRunnable):
+    """Scale a card image on the global thread pool, emitting it through
+signals, a QObject living in the GUI thread."""
+    def __init__(self, key, image, size, signals):
         QtCore.QRunnable.__init__(self)
-        self.card = card
-        self.signals = ImageLoaderSignals()
+        self.key = key
+        self.image = image
+        self.size = size
+        self.signals = signals
 
     def run(self):
-        data = self.card.image_data
-        if data:
-            self.signals.done.emit(self.card, data)
+        self.signals.scaled.emit(self.key, self.size,
+                                 self.image.scaled(self.size, QtCore.Qt.KeepAspectRatio,
+                                                   QtCore.Qt.SmoothTransformation))
+
+
+class ScaledImages(QtCore.QObject):
+    """Card images scaled to the sizes they were shown at, keyed by
+(card_id, golden) and size. Scaling is done on the global thread pool,
+scaled being emitted once a size is available."""
+    scaled = pyqtSignal(tuple, QtCore.QSize)
+
+    def __init__(self, max_size=32 * 1024 * 1024):
+        QtCore.QObject.__init__(self)
+        self.pixmaps = DecodedImages(max_size)
+        self.sizes = {}
+        self.scaling = set()
+        self.signals = ScaleSignals(self)
+        self.signals.scaled.connect(self.done)
+
+    def nearest(self, key, size):
+        sizes = [cached for cached in self.sizes.get(key, ())
+                 if (key, cached) in self.pixmaps]
+        self.sizes[key] = set(sizes)
+        if not sizes:
+            return None
+        area = size[0] * size[1]
+        return self.pixmaps.get((key, min(sizes, key=lambda cached:
+                                          abs(cached[0] * cached[1] - area))))
+
+    def get(self, card, image, size):
+        """Returns the pixmap of image scaled to size if available, the
+nearest one otherwise, starting to scale it if needed. Until a first size
+is available, image is roughly scaled to size, which is cheap enough for
+the GUI thread."""
+        key = ImageLoaderTaskerPool.key(card)
+        size_key = (size.width(), size.height())
+        pixmap = self.pixmaps.get((key, size_key))
+        if pixmap is not None:
+            return pixmap
+        if (key, size_key) not in self.scaling:
+            self.scaling.add((key, size_key))
+            QtCore.QThreadPool.globalInstance().start(
+                ScaleTask(key, image, QtCore.QSize(size), self.signals))
+        pixmap = self.nearest(key, size_key)
+        if pixmap is None:
+            pixmap = QtGui.QPixmap.fromImage(image.scaled(size, QtCore.Qt.KeepAspectRatio,
+                                                          QtCore.Qt.FastTransformation))
+        return pixmap
+
+    @pyqtSlot(tuple, QtCore.QSize, QtGui.QImage)
+    def done(self, key, size, image):
+        size_key = (size.width(), size.height())
+        self.scaling.discard((key, size_key))
+        pixmap = QtGui.QPixmap.fromImage(image)
+        self.pixmaps.put((key, size_key), pixmap, image.byteCount())
+        self.sizes.setdefault(key, set()).add(size_key)
+        self.scaled.emit(key, size)
+
+
+class PendingPack(object):
+    """The cards of a pack waiting for their images, keeping the ones
+already decoded so that they outlive an eviction."""
+    __slots__ = ('cards', 'images', 'missing')
+
+    def __init__(self, cards):
+        self.cards = cards
+        self.images = {}
+        self.missing = 0
 
 
 class ImageLoaderTaskerPool(QtCore.QObject):
+    """Download the card images of submitted packs through manager,
+emitting done with the (card, image) pairs of a pack once all of its
+images are loaded. An image is a QMovie for golden cards, a QImage
+otherwise, or None if it could not be downloaded or decoded."""
     done = pyqtSignal(list)
 
-    def __init__(self):
+    def __init__(self, manager):
         QtCore.QObject.__init__(self)
-        self.pool = QtCore.QThreadPool()
-        self.pool.setMaxThreadCount(5)
-        self.cards = []
-        self.result = {}
-        self.tmpdir = tempfile.mkdtemp()
-
-    def __del__(self):
-        shutil.rmtree(self.tmpdir)
+        self.manager = manager
+        self.images = DecodedImages()
+        self.waiting = {}
+        self.downloading = {}
+
+    @staticmethod
+    def key(card):
+        return (card.card_id, card.golden)
+
+    def decode(self, card, data):
+        """Returns the image held in the QByteArray data and its size in
+bytes, or (None, 0) if it could not be decoded. Golden cards are read by a
+QMovie from an in-memory buffer, keeping the frames decoded."""
+        if card.golden:
+            movie = QtGui.QMovie()
+            buffer = QtCore.QBuffer(movie)
+            buffer.setData(data)
+            buffer.open(QtCore.QIODevice.ReadOnly)
+            movie.setDevice(buffer)
+            movie.setCacheMode(QtGui.QMovie.CacheAll)
+            if not movie.isValid():
+                return None, 0
+            return movie, max(movie.frameCount(), 1) * card.width * card.height * 4
+        image = QtGui.QImage()
+        if not image.loadFromData(data):
+            return None, 0
+        return image, image.byteCount()
+
+    def emit(self, pending):
+        self.done.emit([(card, pending.images[self.key(card)]) for card in pending.cards])
+
+    def release(self, key, image):
+        """Hand image to the packs waiting for it, emitting the ones it
+completes."""
+        for pending in self.waiting.pop(key, ()):
+            pending.images[key] = image
+            pending.missing -= 1
+            if not pending.missing:
+                self.emit(pending)
+
+    def store(self, card, data):
+        """Decode the image of card held in data, keeping it in memory.
+Returns the image, or None if it could not be decoded."""
+        image, size = self.decode(card, data)
+        if image is not None:
+            self.images.put(self.key(card), image, size)
+        return image
 
-    @pyqtSlot(Card, object)
     def add_result(self, card, data):
-        with tempfile.NamedTemporaryFile(dir=self.tmpdir, delete=False) as f:
-            f.write(data)
-        self.result[card] = f.name
-        done_cards = [i for i in self.cards if all(x in self.result.keys() for x in i)]
-        self.cards = [i for i in self.cards if not all(x in self.result.keys() for x in i)]
-        for done in done_cards:
-            self.done.emit([(x, self.result[x]) for x in done])
+        self.release(self.key(card), self.store(card, data))
 
-    def get_images(self, pack):
-        self.cards.append(pack.cards)
-        for card in pack.cards:
-            if card in self.result.keys():
-                self.add_result(card, self.result[card])
+    @pyqtSlot()
+    def downloaded(self):
+        """Handle the reply to an image request, which revalidates the
+stale data of the image cached, if any."""
+        reply = self.sender()
+        card, start, cached, entry = self.downloading.pop(reply)
+        metrics.IMAGE_SECONDS.observe(time.time() - start, start)
+        status = reply_status(reply)
+        data = reply.readAll() if status == 200 else None
+        headers = reply_headers(reply, ('ETag', 'Last-Modified', 'Cache-Control'))
+        reply.deleteLater()
+        if status == 304 and cached:
+            self.add_result(card, QtCore.QByteArray(cached))
+            try:
+                images.cache.refresh(card.img_src, entry, headers)
+            except (IOError, OSError):
+                pass
+            return
+        if data is None or data.isEmpty():
+            if cached:
+                self.add_result(card, QtCore.QByteArray(cached))
             else:
-                worker = ImageLoaderWorker(card)
-                worker.signals.done.connect(self.add_result)
-                self.pool.start(worker)
+                self.release(self.key(card), None)
+            return
+        self.add_result(card, data)
+        if images.cache:
+            try:
+                images.cache.put(card.img_src, data.data(), headers)
+            except (IOError, OSError):
+                pass
+
+    def get_images(self, pack):
+        pending = PendingPack(pack.cards)
+        for card in set(pack.cards):
+            key = self.key(card)
+            image = self.images.get(key)
+            if image is not None:
+                metrics.IMAGES_MEMORY.inc()
+                pending.images[key] = image
+                continue
+            if key in self.waiting:
+                pending.missing += 1
+                self.waiting[key].append(pending)
+                continue
+            data, entry = images.cache.lookup(card.img_src) if images.cache else (None, None)
+            if data and images.cache.fresh(entry):
+                metrics.IMAGES_DISK.inc()
+                pending.images[key] = self.store(card, QtCore.QByteArray(data))
+                continue
+            metrics.IMAGES_NETWORK.inc()
+            pending.missing += 1
+            self.waiting[key] = [pending]
+            request = QNetworkRequest(QtCore.QUrl(card.img_src))
+            if data:
+                for name, value in images.cache.conditional_headers(entry).items():
+                    request.setRawHeader(name.encode('ascii'), value.encode('latin-1'))
+            reply = self.manager.get(request)
+            self.downloading[reply] = (card, time.time(), data, entry)
+            reply.finished.connect(self.downloaded)
+        if not pending.missing:
+            self.emit(pending)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: images.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, division
+
+import os
+import re
+import time
+import hashlib
+import threading
+import requests
+import simplejson
+from hearthpacks_constants import CACHE_DIR
+from hearthpacks import metrics
+from hearthpacks.transport import account_response
+from hearthpacks.utils import atomic_write, ensure_dir
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+def max_age(headers):
+    """Returns for how many seconds a response can be used without being
+revalidated, according to its Cache-Control header."""
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0
+    match = MAX_AGE.search(cache_control)
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class ImageCache(object):
+    """Persistent content-addressed image cache.
+Images are stored under objects/ by the sha256 of their content, and
+index/ maps the sha1 of each URL to a content hash, along with the ETag
+and Last-Modified validators of the response and the time until which it is
+fresh. Reading an image refreshes its mtime, and the least recently used
+images are evicted once the cache grows over max_size bytes."""
+    def __init__(self, directory=CACHE_DIR, max_size=200 * 1024 * 1024):
+        self.directory = directory
+        self.objects = os.path.join(directory, 'objects')
+        self.index = os.path.join(directory, 'index')
+        self.max_size = max_size
+        self.size = None
+        self.lock = threading.Lock()
+        ensure_dir(self.objects)
+        ensure_dir(self.index)
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def entry(self, url):
+        """Returns the index entry of url, or None."""
+        return self.read_entry(os.path.join(self.index, self.key(url)))
+
+    @staticmethod
+    def read_entry(path):
+        """Returns the index entry stored at path, or None. Entries written
+before validators were kept only hold the digest, and are stale."""
+        try:
+            with open(path, 'r') as f:
+                content = f.read().strip()
+        except (IOError, OSError):
+            return None
+        try:
+            return simplejson.loads(content)
+        except ValueError:
+            return {'digest': content, 'expires': 0}
+
+    def write_entry(self, url, entry):
+        atomic_write(self.index, self.key(url), simplejson.dumps(entry).encode('ascii'))
+
+    def path(self, url, entry=None):
+        """Returns the path of the cached image for url, or None."""
+        entry = entry or self.entry(url)
+        if entry is None:
+            return None
+        path = os.path.join(self.objects, entry['digest'])
+        try:
+            os.utime(path, None)
+        except OSError:
+            try:
+                os.remove(os.path.join(self.index, self.key(url)))
+            except OSError:
+                pass
+            return None
+        return path
+
+    def lookup(self, url):
+        """Returns the cached image data for url and its index entry,
+or (None, None)."""
+        entry = self.entry(url)
+        path = self.path(url, entry) if entry else None
+        if path is None:
+            return None, None
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), entry
+        except (IOError, OSError):
+            return None, None
+
+    def get(self, url):
+        """Returns the cached image data for url, or None."""
+        return self.lookup(url)[0]
+
+    @staticmethod
+    def fresh(entry):
+        return entry.get('expires', 0) > time.time()
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Returns the headers revalidating the image of entry."""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, data, headers=None):
+        """Store the image data of url along with the validators of the
+response headers, returns the path of the cached image."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.objects, digest)
+        if not os.path.exists(path):
+            atomic_write(self.objects, digest, data)
+            with self.lock:
+                if self.size is not None:
+                    self.size += len(data)
+        self.write_entry(url, self.validated({'digest': digest}, headers or {}))
+        self.evict()
+        return path
+
+    def refresh(self, url, entry, headers):
+        """Mark the image of url fresh again after a 304 response."""
+        self.write_entry(url, self.validated(dict(entry), headers))
+
+    @staticmethod
+    def validated(entry, headers):
+        """Returns entry updated with the validators and freshness of the
+response headers."""
+        for key, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified')):
+            if headers.get(header):
+                entry[key] = headers.get(header)
+        entry['expires'] = time.time() + max_age(headers)
+        return entry
+
+    def evict(self):
+        """Remove the least recently used images while over max_size,
+along with the index entries pointing at them."""
+        with self.lock:
+            if self.size is not None and self.size <= self.max_size:
+                return
+            entries = []
+            for name in os.listdir(self.objects):
+                if name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.objects, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            self.size = sum(size for _, size, _ in entries)
+            if self.size <= self.max_size:
+                return
+            entries.sort()
+            target = self.max_size * 9 // 10
+            evicted = set()
+            for mtime, size, name in entries:
+                if self.size <= target:
+                    break
+                try:
+                    os.remove(os.path.join(self.objects, name))
+                except OSError:
+                    continue
+                self.size -= size
+                evicted.add(name)
+            if evicted:
+                self.prune(evicted)
+
+    def prune(self, digests):
+        """Remove the index entries pointing at one of digests."""
+        for name in os.listdir(self.index):
+            if name.startswith('.tmp-'):
+                continue
+            path = os.path.join(self.index, name)
+            entry = self.read_entry(path)
+            if entry is not None and entry.get('digest') in digests:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+cache = None
+session = None
+
+def configure(opts, http_session=None):
+    """Set up the shared image cache from --cache-dir and --cache-size,
+a size of 0 or an unusable directory disabling it.
+Images are then downloaded through http_session if provided, reusing its
+connections."""
+    global cache, session
+    cache = None
+    session = http_session
+    if opts['--cache-size']:
+        try:
+            cache = ImageCache(opts['--cache-dir'] or CACHE_DIR,
+                               opts['--cache-size'] * 1024 * 1024)
+        except OSError:
+            pass
+    return cache
+
+def load(url):
+    """Returns the data of the image at url, from the shared cache if possible.
+A cached image which is no longer fresh is revalidated with a conditional
+request, and still used if the request fails.
+Returns None if the image could not be retrieved."""
+    data, entry, headers = None, None, {}
+    if cache:
+        data, entry = cache.lookup(url)
+        if data and cache.fresh(entry):
+            return data
+        if data:
+            headers = cache.conditional_headers(entry)
+    try:
+        with metrics.IMAGE_SECONDS.time():
+            if session:
+                r = session.get(url, timeout=10, headers=headers)
+            else:
+                r = requests.get(url, timeout=10, headers=headers,
+                                 hooks={'response': account_response})
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+            requests.exceptions.RetryError):
+        return data
+    if r.status_code == 304 and data:
+        try:
+            cache.refresh(url, entry, r.headers)
+        except (IOError, OSError):
+            pass
+        return data
+    if not r:
+        return data
+    if cache:
+        try:
+            cache.put(url, r.content, r.headers)
+        except (IOError, OSError):
+            pass
+    return r.content
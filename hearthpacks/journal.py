@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: journal.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, division
+
+import os
+import re
+import time
+import atexit
+import threading
+import simplejson
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from hearthpacks import metrics
+from hearthpacks.utils import atomic_write, ensure_dir
+
+SEGMENT_RE = re.compile(r'^packs-(\d{6})\.jsonl$')
+SEGMENT_SIZE = 64 * 1024 * 1024
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 1.0
+QUEUE_SIZE = 65536
+TAIL_BLOCK = 64 * 1024
+
+def segment_name(number):
+    return 'packs-%06d.jsonl' % (number)
+
+def summary_name(segment):
+    return segment[:-len('.jsonl')] + '.summary.json'
+
+def segments(directory):
+    """Returns the segment file names of the journal in directory, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(name for name in names if SEGMENT_RE.match(name))
+
+def read_segment(path, offset=0):
+    """Yield the (offset, record) of every complete record of a segment
+starting at offset, offset being the position after the record."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                yield offset, simplejson.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+
+def tail(directory, count=10):
+    """Returns the last count records of the journal in directory, reading
+the segments backwards."""
+    records = []
+    for name in reversed(segments(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position, data = f.tell(), b''
+            while position > 0 and data.count(b'\n') <= count - len(records):
+                size = min(TAIL_BLOCK, position)
+                position -= size
+                f.seek(position)
+                data = f.read(size) + data
+        lines = data.split(b'\n')
+        if position > 0:
+            lines = lines[1:]
+        found = []
+        for line in lines:
+            try:
+                found.append(simplejson.loads(line.decode('utf-8')))
+            except ValueError:
+                continue
+        records = found[-(count - len(records)):] + records
+        if len(records) >= count:
+            break
+    return records
+
+def empty_stats():
+    return {'opened': 0, 'saved': 0, 'failed': 0,
+            'score_sum': 0, 'score_min': None, 'score_max': None,
+            'first': None, 'last': None}
+
+def add_record(summary, record):
+    """Account for a record in a {pack type: stats} summary."""
+    if record.get('event') == 'open':
+        stats = summary.setdefault(record['type'], empty_stats())
+        score = record['score']
+        stats['opened'] += 1
+        stats['score_sum'] += score
+        stats['score_min'] = score if stats['score_min'] is None else min(stats['score_min'], score)
+        stats['score_max'] = score if stats['score_max'] is None else max(stats['score_max'], score)
+        stats['first'] = record['ts'] if stats['first'] is None else stats['first']
+        stats['last'] = record['ts']
+    elif record.get('event') == 'save':
+        stats = summary.setdefault(record['type'], empty_stats())
+        stats['saved' if record['ok'] else 'failed'] += 1
+
+def merge_summaries(summary, other):
+    for pack_type, stats in other.items():
+        if pack_type not in summary:
+            summary[pack_type] = dict(stats)
+            continue
+        merged = summary[pack_type]
+        for key in ('opened', 'saved', 'failed', 'score_sum'):
+            merged[key] += stats[key]
+        for key, pick in (('score_min', min), ('score_max', max),
+                          ('first', min), ('last', max)):
+            values = [v for v in (merged[key], stats[key]) if v is not None]
+            merged[key] = pick(values) if values else None
+    return summary
+
+def summarize(path):
+    summary = {}
+    for offset, record in read_segment(path):
+        add_record(summary, record)
+    return summary
+
+def aggregate(directory):
+    """Returns the {pack type: stats} summary of the whole journal in
+directory. Rotated segments are summarized once in a sidecar file, so only
+the active segment is scanned."""
+    summary = {}
+    names = segments(directory)
+    for i, name in enumerate(names):
+        path = os.path.join(directory, name)
+        if i == len(names) - 1:
+            merge_summaries(summary, summarize(path))
+            continue
+        try:
+            with open(os.path.join(directory, summary_name(name)), 'r') as f:
+                merge_summaries(summary, simplejson.load(f))
+        except (IOError, OSError, ValueError):
+            segment_summary = summarize(path)
+            try:
+                atomic_write(directory, summary_name(name),
+                             simplejson.dumps(segment_summary).encode('utf-8'))
+            except (IOError, OSError):
+                pass
+            merge_summaries(summary, segment_summary)
+    return summary
+
+
+class Journal(object):
+    """Append-only history of opened and saved packs.
+Records are JSON lines in size-rotated segments, written in batches by a
+background thread: recording never blocks, records being dropped and
+counted if the writer falls too far behind."""
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.queue = queue.Queue(QUEUE_SIZE)
+        metrics.JOURNAL_QUEUE.set_function(self.queue.qsize)
+        self.dropped = 0
+        self.written = 0
+        self.cards = set()
+        ensure_dir(directory)
+        names = segments(directory)
+        self.number = int(SEGMENT_RE.match(names[-1]).group(1)) if names else 1
+        self.file = open(os.path.join(directory, segment_name(self.number)), 'ab')
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, event, **fields):
+        fields['event'] = event
+        fields['ts'] = round(time.time(), 3)
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_open(self, pack):
+        """Record an opened pack, and the cards it holds that were not
+recorded yet by this journal, building up a catalog of the card names."""
+        for card in pack.cards:
+            if (card.card_id, card.golden) not in self.cards:
+                self.cards.add((card.card_id, card.golden))
+                self.record('card', id=card.card_id, golden=card.golden,
+                            name=card.name, img_src=card.img_src)
+        self.record('open', uid=pack.uid, type=pack.pack_type, score=pack.score,
+                    cards=[[card.card_id, card.golden] for card in pack.cards])
+
+    def record_save(self, pack, title, ok):
+        self.record('save', uid=pack.uid, type=pack.pack_type, title=title, ok=ok)
+
+    def run(self):
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = [record for record in batch if record is not None]
+                running = False
+            self.write(batch)
+
+    def write(self, batch):
+        if not batch:
+            return
+        self.file.write(b''.join(simplejson.dumps(record).encode('utf-8') + b'\n'
+                                 for record in batch))
+        self.file.flush()
+        self.written += len(batch)
+        if self.file.tell() >= self.segment_size:
+            self.rotate()
+
+    def rotate(self):
+        name = segment_name(self.number)
+        self.file.close()
+        try:
+            atomic_write(self.directory, summary_name(name),
+                         simplejson.dumps(summarize(os.path.join(self.directory, name)))
+                         .encode('utf-8'))
+        except (IOError, OSError):
+            pass
+        self.number += 1
+        self.file = open(os.path.join(self.directory, segment_name(self.number)), 'ab')
+
+    def close(self):
+        """Write the pending records and stop the writer."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if not self.file.closed:
+            self.file.close()
@@ -8,9 +8,13 @@
 
 from __future__ import print_function, absolute_import, unicode_literals
 
+import os
 import getpass
 import requests
-from bs4 import BeautifulSoup
+import simplejson
+from hearthpacks import metrics
+from hearthpacks.transport import make_session
+from hearthpacks.utils import atomic_write, ensure_dir
 
 try:
     input = raw_input
@@ -29,22 +33,88 @@ class LoginError(Exception):
     pass
 
 
+def load_sessions(filename):
+    try:
+        with open(filename, 'r') as f:
+            return simplejson.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def restore_session(s, opts, email):
+    """Restore the cookies saved for email from --session-file into s.
+Check them with one request to LOGIN_FRONTPOINT, which redirects logged in
+users instead of showing the login form.
+Returns a (restored, response) tuple, response being the login page
+requested while checking, if any."""
+    if not opts['--session-file']:
+        return False, None
+    cookies = [requests.cookies.create_cookie(**cookie) for cookie in
+               load_sessions(opts['--session-file']).get(email, ())]
+    if not cookies:
+        return False, None
+    for cookie in cookies:
+        s.cookies.set_cookie(cookie)
+    try:
+        r = s.get(LOGIN_FRONTPOINT, allow_redirects=False)
+    except (requests.exceptions.ConnectionError, requests.exceptions.RetryError):
+        r = None
+    if (r is not None and 'User.ID' in s.cookies and
+        (r.is_redirect or (r.ok and b'p-login-form' not in r.content))):
+        return True, None
+    for cookie in cookies:
+        if s.cookies.get(cookie.name, domain=cookie.domain, path=cookie.path) == cookie.value:
+            s.cookies.clear(cookie.domain, cookie.path, cookie.name)
+    return False, r if r and not r.is_redirect else None
+
+def save_session(s, opts, email):
+    """Save the cookies of s for email in --session-file, readable by the
+current user only."""
+    if not opts['--session-file']:
+        return
+    directory, filename = os.path.split(os.path.abspath(opts['--session-file']))
+    sessions = load_sessions(opts['--session-file'])
+    sessions[email] = [{
+        'name': cookie.name,
+        'value': cookie.value,
+        'domain': cookie.domain,
+        'path': cookie.path,
+        'secure': cookie.secure,
+        'expires': cookie.expires,
+    } for cookie in s.cookies if not cookie.is_expired()]
+    try:
+        ensure_dir(directory)
+        atomic_write(directory, filename, simplejson.dumps(sessions).encode('utf-8'))
+    except (IOError, OSError):
+        pass
+
+
+@metrics.timed(metrics.LOGIN_SECONDS)
 def login(opts):
     """Logs you on HearthPwn.com, asking for credentials via stdin.
+The session saved in --session-file is reused while it is still valid.
 Returns a requests.Session object."""
-    s = requests.Session()
+    s = make_session(opts)
     s.headers.update(HEADERS)
     if not opts['--anonymous']:
-        try:
-            r = s.get(LOGIN_FRONTPOINT)
-        except requests.ConnectionError as e:
-            r = None
-        if not r:
-            raise LoginError("Unable to connect")
         email = (opts["email"] if "email" in opts
                  else input('Enter your email address: '))
+        restored, r = restore_session(s, opts, email)
+        if restored:
+            if opts['--verbose'] >= 1:
+                print('Login session restored')
+                print('User.ID is %s' % (s.cookies['User.ID']))
+                print('Username is %s' % (s.cookies['User.Username']))
+            return s
+        if r is None:
+            try:
+                r = s.get(LOGIN_FRONTPOINT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.RetryError):
+                r = None
+        if not r:
+            raise LoginError("Unable to connect")
         password = (opts["password"] if "password" in opts
                     else getpass.getpass('Enter your password: '))
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(r.content, "html.parser")
         hidden_fields = (soup.find('div', class_='p-login-form').find('form')
                          .find_all('input', type='hidden'))
@@ -59,6 +129,7 @@ Returns a requests.Session object."""
             soup = BeautifulSoup(r.content, "html.parser")
             error = soup.find('ul', class_='field-errors').find('li').text
             raise LoginError(error)
+        save_session(s, opts, email)
         if opts['--verbose'] >= 1:
             print('Login successful')
             print('User.ID is %s' % (s.cookies['User.ID']))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: metrics.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import, division
+
+import sys
+import time
+import functools
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10)
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % (','.join('%s="%s"' % (key, labels[key])
+                              for key in sorted(labels)))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge(object):
+    """Value read from a function when the metrics are rendered."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = lambda: 0
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        yield self.name, self.labels, self.function()
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value, start=None):
+        """Account for a value, and for a trace span of value seconds if
+start is given and a tracer is set."""
+        if start is not None and tracer:
+            tracer.span(self.labels['phase'] if self.labels else self.name, start, value)
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        return Timer(self)
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the quantile q."""
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        seen = 0
+        for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+            seen += bucket
+            if count and seen >= q * count:
+                return bound
+        return 0
+
+    def samples(self):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        seen = 0
+        for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+            seen += bucket
+            yield self.name + '_bucket', dict(self.labels or {}, le=bound), seen
+        yield self.name + '_sum', self.labels, total
+        yield self.name + '_count', self.labels, count
+
+
+class Timer(object):
+    """Context manager observing the time spent in its block."""
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.time() - self.start, self.start)
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for metric in self.metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append('# HELP %s %s' % (metric.name, metric.help))
+                lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+tracer = None
+
+def phase(name):
+    return registry.register(Histogram('hearthpacks_phase_seconds',
+                                       'Time spent in each phase.',
+                                       {'phase': name}))
+
+LOGIN_SECONDS = phase('login')
+OPEN_SECONDS = phase('open')
+PARSE_SECONDS = phase('parse')
+CHECK_SECONDS = phase('check')
+SAVE_SECONDS = phase('save')
+IMAGE_SECONDS = phase('image')
+PACKS_OPENED = registry.register(Counter('hearthpacks_packs_opened_total',
+                                         'Packs opened.'))
+PACKS_FAILED = registry.register(Counter('hearthpacks_packs_failed_total',
+                                         'Packs that could not be opened.'))
+PACKS_SUBMITTED = registry.register(Counter('hearthpacks_packs_submitted_total',
+                                            'Packs saved to HearthPwn.com.'))
+SAVES_FAILED = registry.register(Counter('hearthpacks_saves_failed_total',
+                                         'Packs that could not be saved.'))
+BYTES_RECEIVED = registry.register(Counter('hearthpacks_received_bytes_total',
+                                           'Bytes of pack pages received.'))
+BYTES_SKIPPED = registry.register(Counter('hearthpacks_skipped_bytes_total',
+                                          'Bytes of streamed pack pages left unread.'))
+SUBMISSION_QUEUE = registry.register(Gauge('hearthpacks_queue_depth',
+                                           'Items waiting in a queue.',
+                                           {'queue': 'submission'}))
+JOURNAL_QUEUE = registry.register(Gauge('hearthpacks_queue_depth',
+                                        'Items waiting in a queue.',
+                                        {'queue': 'journal'}))
+
+def image_source(name):
+    return registry.register(Counter('hearthpacks_images_total',
+                                     'Card images displayed, by source.',
+                                     {'source': name}))
+
+IMAGES_MEMORY = image_source('memory')
+IMAGES_DISK = image_source('disk')
+IMAGES_NETWORK = image_source('network')
+
+ENDPOINTS = ('login', 'simulator', 'save', 'image')
+
+def per_endpoint(name, help):
+    return dict((endpoint, registry.register(Counter(name, help, {'endpoint': endpoint})))
+                for endpoint in ENDPOINTS)
+
+HTTP_REQUESTS = per_endpoint('hearthpacks_http_requests_total',
+                             'HTTP requests sent, by endpoint.')
+HTTP_SENT = per_endpoint('hearthpacks_http_sent_bytes_total',
+                         'Bytes of HTTP requests sent, headers included.')
+HTTP_WIRE = per_endpoint('hearthpacks_http_wire_bytes_total',
+                         'Bytes of HTTP responses received, headers included.')
+HTTP_DECODED = per_endpoint('hearthpacks_http_decoded_bytes_total',
+                            'Bytes of HTTP response bodies once decoded.')
+HTTP_COMPRESSED = per_endpoint('hearthpacks_http_compressed_total',
+                               'HTTP responses received compressed.')
+HTTP_NOT_MODIFIED = per_endpoint('hearthpacks_http_not_modified_total',
+                                 'HTTP responses telling a cached copy is still valid.')
+
+def account(endpoint, sent, wire, decoded, compressed=False, not_modified=False):
+    """Count an HTTP exchange with endpoint, one of ENDPOINTS."""
+    HTTP_REQUESTS[endpoint].inc()
+    HTTP_SENT[endpoint].inc(sent)
+    HTTP_WIRE[endpoint].inc(wire)
+    HTTP_DECODED[endpoint].inc(decoded)
+    if compressed:
+        HTTP_COMPRESSED[endpoint].inc()
+    if not_modified:
+        HTTP_NOT_MODIFIED[endpoint].inc()
+
+def timed(histogram):
+    """Decorator observing the duration of every call in histogram."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time():
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def serve(port, host='127.0.0.1'):
+    """Serve the metrics on http://host:port/metrics from a background thread.
+Returns the server, to be shut down by the caller."""
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from socketserver import ThreadingMixIn
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from SocketServer import ThreadingMixIn
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    class MetricsServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = MetricsServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def summary(elapsed):
+    """Returns a one-line summary of the metrics, elapsed being the
+number of seconds since the run started."""
+    return ('%d packs (%.1f/s), %d failed, %d submitted, %d saves failed, '
+            'open p50 %dms p99 %dms, parse p50 %.1fms, %d queued' % (
+                PACKS_OPENED.value, PACKS_OPENED.value / max(elapsed, 1e-9),
+                PACKS_FAILED.value, PACKS_SUBMITTED.value, SAVES_FAILED.value,
+                OPEN_SECONDS.quantile(0.5) * 1000, OPEN_SECONDS.quantile(0.99) * 1000,
+                PARSE_SECONDS.quantile(0.5) * 1000, SUBMISSION_QUEUE.function()))
+
+
+def bandwidth_summary():
+    """Returns a table of the bytes sent and received for each endpoint,
+received bytes being counted as on the wire and once decoded."""
+    lines = ['%-10s %8s %12s %12s %12s %10s %8s' % (
+        'endpoint', 'requests', 'sent', 'wire', 'decoded', 'compressed', '304')]
+    totals = [0] * 6
+    for endpoint in ENDPOINTS:
+        row = [HTTP_REQUESTS[endpoint].value, HTTP_SENT[endpoint].value,
+               HTTP_WIRE[endpoint].value, HTTP_DECODED[endpoint].value,
+               HTTP_COMPRESSED[endpoint].value, HTTP_NOT_MODIFIED[endpoint].value]
+        totals = [total + value for total, value in zip(totals, row)]
+        if row[0]:
+            lines.append('%-10s %8d %12d %12d %12d %10d %8d' % tuple([endpoint] + row))
+    lines.append('%-10s %8d %12d %12d %12d %10d %8d' % tuple(['total'] + totals))
+    return '\n'.join(lines)
+
+
+class Reporter(object):
+    """Print the summary every interval seconds from a background thread."""
+    def __init__(self, interval, file=sys.stdout):
+        self.interval = interval
+        self.file = file
+        self.start = time.time()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            print(summary(time.time() - self.start), file=self.file)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: pacing.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import, division
+
+import threading
+from hearthpacks.utils import TokenBucket
+
+INCREASE = 0.05
+DECREASE = 0.5
+SLOW_LATENCY = 3.0
+THROTTLE_STATUSES = (408, 429)
+
+class Pacer(object):
+    """Additive increase, multiplicative decrease pacing of pack openings.
+The rate grows by INCREASE packs per second after every healthy response,
+and is multiplied by DECREASE after a timeout, a connection error, a
+throttling or server error status, or a response slower than SLOW_LATENCY,
+always staying between min_rate and max_rate.
+Openings are spaced by a token bucket, so the time spent in a request
+counts towards the interval before the next one."""
+    def __init__(self, rate, min_rate, max_rate, capacity=1, verbose=0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.verbose = verbose
+        self.bucket = TokenBucket(self.rate, capacity)
+        self.lock = threading.Lock()
+
+    def record(self, latency, status):
+        """Account for a response received after latency seconds, status
+being None if no response was received."""
+        trouble = (status is None or status in THROTTLE_STATUSES or
+                   status >= 500 or latency > SLOW_LATENCY)
+        with self.lock:
+            previous = self.rate
+            if trouble:
+                self.rate = max(self.rate * DECREASE, self.min_rate)
+            elif status < 400:
+                self.rate = min(self.rate + INCREASE, self.max_rate)
+            if self.rate == previous:
+                return
+            self.bucket.set_rate(self.rate)
+        if trouble and self.verbose >= 1:
+            print('Slowing down to %.2f packs per second' % (self.rate))
+
+    def reserve(self):
+        return self.bucket.reserve()
+
+    def acquire(self):
+        self.bucket.acquire()
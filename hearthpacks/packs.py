@@ -9,26 +9,46 @@
 from __future__ import print_function, absolute_import, unicode_literals
 
 import sys
+import time
+import uuid
+import threading
+import weakref
 import requests
-from bs4 import BeautifulSoup
+from hearthpacks_constants import PACKS_FRONTPOINT, PACKS_TYPE, PACKS_ENDPOINT
+from hearthpacks import images
+from hearthpacks import metrics
+from hearthpacks.transport import account_read
+from hearthpacks.parser import parse_pack, PackParser
+from hearthpacks.sketch import ScoreSketch, WARMUP
+
+STREAM_CHUNK = 8192
 
 try:
     input = raw_input
 except NameError:
     pass
 
-PACKS_FRONTPOINT = {
-    'wild': "http://www.hearthpwn.com/packs/simulator/1",
-    # 'tgt': "http://www.hearthpwn.com/packs/simulator/2",
-    # 'wog': "http://www.hearthpwn.com/packs/simulator/3",
-    # 'golden-wog': "http://www.hearthpwn.com/packs/simulator/4",
-    # 'msg': "http://www.hearthpwn.com/packs/simulator/5",
-    # 'accurate-msg': "http://www.hearthpwn.com/packs/simulator/6",
-    'jtu': "http://www.hearthpwn.com/packs/simulator/7",
-    'koft': "http://www.hearthpwn.com/packs/simulator/8",
-}
-PACKS_TYPE = list(PACKS_FRONTPOINT.keys())
-PACKS_ENDPOINT = "http://www.hearthpwn.com/packs/save"
+def read_streamed(r):
+    """Feed the body of a streamed simulator response to a PackParser by
+chunks, closing the response as soon as the pack is parsed.
+Returns the record of the page, the number of bytes read and the number of
+bytes left unread."""
+    parser = PackParser()
+    decoded = 0
+    try:
+        for chunk in r.iter_content(STREAM_CHUNK):
+            decoded += len(chunk)
+            parser.feed(chunk)
+            if parser.done:
+                break
+        received = r.raw.tell()
+    finally:
+        r.close()
+    account_read(r, decoded)
+    length = r.headers.get('Content-Length', '')
+    skipped = max(int(length) - received, 0) if length.isdigit() else 0
+    return parser.record, received, skipped
+
 
 class PackError(Exception):
     """Pack error exception class."""
@@ -36,28 +56,37 @@ class PackError(Exception):
 
 
 class Card(object):
-    def __init__(self, li):
-        self.card_id = int(li['data-id'])
-        self.golden = "is-gold" in li.attrs['class']
-        href = li.find('a', class_='card-front')['href']
-        self.name = href.replace('/cards/%d-' % (self.card_id), '').replace('-', ' ')
-        if self.golden:
-            src = li.find('video')
-            self.img_src = src['data-gifurl']
-        else:
-            src = li.find('img')
-            self.img_src = src['src']
-        self.width = int(src['width'])
-        self.height = int(src['height'])
+    """A card as seen in a pack. Use Card.intern so that every pack holding
+the same card shares one instance, and its image data."""
+    __slots__ = ('card_id', 'golden', 'name', 'img_src', 'width', 'height',
+                 '_image_data', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+    interned_lock = threading.Lock()
+
+    def __init__(self, card_id, golden, name, img_src, width, height):
+        self.card_id = card_id
+        self.golden = golden
+        self.name = name
+        self.img_src = img_src
+        self.width = width
+        self.height = height
         self._image_data = None
 
+    @classmethod
+    def intern(cls, card_id, golden, name, img_src, width, height):
+        """Returns the live Card instance for (card_id, golden),
+creating it if needed."""
+        with cls.interned_lock:
+            card = cls.interned.get((card_id, golden))
+            if card is None:
+                card = cls(card_id, golden, name, img_src, width, height)
+                cls.interned[(card_id, golden)] = card
+            return card
+
     @property
     def image_data(self):
         if not self._image_data:
-            try:
-                self._image_data = requests.get(self.img_src).content
-            except requests.ConnectionError:
-                pass
+            self._image_data = images.load(self.img_src)
         return self._image_data
 
     def __str__(self):
@@ -68,18 +97,31 @@ class Card(object):
 
 
 class Pack(object):
-    def __init__(self, request=None):
-        self.request = request
+    """An opened pack. Only the fields needed to display and save it are
+kept, the response it was parsed from is not."""
+    __slots__ = ('uid', 'pack_type', 'score', 'cards', 'params', 'title_field',
+                 'submitted')
+
+    def __init__(self, request=None, content=None, record=None):
+        """Build the pack from the response to the simulator request, from
+its content, or from the record parse_pack returned for it."""
+        self.uid = uuid.uuid4().hex
+        self.pack_type = None
         self.submitted = False
         if request:
-            self.soup = BeautifulSoup(request.content, "html.parser")
-            self.score = int(self.soup.find('span', class_='pack-score')['data-score'])
-            cards_tag = self.soup.find('ul', class_='pack-results').find_all('li')
-            self.cards = [Card(li) for li in cards_tag]
+            content = request.content
+        if content or record:
+            with metrics.PARSE_SECONDS.time():
+                if record is None:
+                    record = parse_pack(content)
+                self.score, cards, params, self.title_field = record
+                self.cards = tuple(Card.intern(*card) for card in cards)
+                self.params = tuple(params)
         else:
-            self.soup = BeautifulSoup("", "html.parser")
             self.score = 0
-            self._cards = ()
+            self.cards = ()
+            self.params = ()
+            self.title_field = None
 
     def __str__(self):
         return self.__repr__()
@@ -89,53 +131,154 @@ class Pack(object):
 
 
 class PackOpener(object):
-    def __init__(self, opts, session):
+    """Open and save packs, keeping track of the best one.
+The scores are accounted in the sketch of the pack type found in sketches,
+so a caller opening several runs can pass the same dict to keep estimating
+the distributions across them."""
+    def __init__(self, opts, session, journal=None, sketches=None):
         self.opts = opts
         self.session = session
+        self.journal = journal
+        self.submissions = None
+        self.pacer = None
+        self.parsers = None
         self.best_pack = Pack()
+        self.top_score = 0
         self.counter = 0
+        self.threshold = opts['--threshold']
+        sketches = {} if sketches is None else sketches
+        self.sketch = sketches.setdefault(opts['PACK_TYPE'], ScoreSketch())
+        self.lock = threading.Lock()
 
-    def submit_threshold(self, pack):
-        if pack.score >= self.opts['--threshold']:
+    def reach_threshold(self, pack):
+        if pack.score >= self.threshold:
             if self.opts['--verbose'] >= 1:
                 print('Pack has reached the threshold, pack is:')
                 print(pack)
-            self.save_pack(self.opts['--threshold-comment'], pack)
+            return True
+        return False
 
-    def submit_low(self, pack):
+    def reach_low(self, pack):
         if pack.score <= self.opts['--low-threshold']:
             if self.opts['--verbose'] >= 1:
                 print('Pack is below low threshold, is:')
                 print(pack)
-            self.save_pack(self.opts['--low-threshold-comment'], pack)
+            return True
+        return False
+
+    def consider(self, pack):
+        """Account for an opened pack and keep track of the best one.
+Raise a PackError if the pack is invalid.
+Returns the list of (title, pack) to submit according to the thresholds."""
+        if pack.score == 0:
+            metrics.PACKS_FAILED.inc()
+            raise PackError("Unable to acquire pack")
+        metrics.PACKS_OPENED.inc()
+        pack.pack_type = self.opts['PACK_TYPE']
+        if self.journal:
+            self.journal.record_open(pack)
+        with self.lock:
+            self.counter += 1
+            counter = self.counter
+            self.top_score = max(self.top_score, pack.score)
+            self.sketch.add(pack.score)
+            if (self.opts['--target-percentile'] is not None and
+                self.sketch.count >= WARMUP):
+                self.threshold = self.sketch.quantile(self.opts['--target-percentile'] / 100)
+            previous = None
+            if (self.opts['--score'] != -1 and
+                pack.score > self.best_pack.score and
+                pack.score > self.opts['--score']):
+                previous, self.best_pack = self.best_pack, pack
+        if self.opts['--verbose'] >= 1:
+            print('Pack #%d opened, score is: %d' % (counter, pack.score))
+        submissions = []
+        if previous is not None:
+            if self.reach_threshold(previous):
+                submissions.append((self.opts['--threshold-comment'], previous))
+            if self.opts['--verbose'] >= 1:
+                print('New best pack found!')
+                print(pack)
+        else:
+            if self.reach_threshold(pack):
+                submissions.append((self.opts['--threshold-comment'], pack))
+            if self.reach_low(pack):
+                submissions.append((self.opts['--low-threshold-comment'], pack))
+        return submissions
+
+    def should_stop(self, remaining):
+        """Returns True if opening the remaining attempts is not worth it,
+the expected improvement of the best score being below --min-gain.
+Never stops before WARMUP packs have been opened."""
+        if not self.opts['--min-gain']:
+            return False
+        with self.lock:
+            if self.sketch.count < WARMUP:
+                return False
+            gain = self.sketch.expected_gain(self.top_score, remaining)
+        if gain < self.opts['--min-gain']:
+            if self.opts['--verbose'] >= 1:
+                print('Stopping with %d attempts left, expected gain is: %d'
+                      % (remaining, gain))
+            return True
+        return False
 
     def open_pack(self):
         """Open a pack from HearthPwn.com using request.Session object retrieved from login.
 Raise a PackError if the pack could not be retrieved.
 Returns the Pack object of the opened pack."""
+        start = time.time()
+        record = None
         try:
-            r = self.session.get(PACKS_FRONTPOINT[self.opts['PACK_TYPE']], timeout=5)
-        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            r = self.session.get(PACKS_FRONTPOINT[self.opts['PACK_TYPE']], timeout=5,
+                                 stream=self.opts['--stream'])
+            if self.opts['--stream'] and r:
+                record, received, skipped = read_streamed(r)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                requests.exceptions.RetryError, requests.exceptions.ChunkedEncodingError):
             r = None
-        pack = Pack(r)
-        if pack.score == 0:
-            raise PackError("Unable to acquire pack")
-        self.counter += 1
-        if self.opts['--verbose'] >= 1:
-            print('Pack #%d opened, score is: %d' % (self.counter, pack.score))
-        if (self.opts['--score'] != -1 and
-            pack.score > self.best_pack.score and
-            pack.score > self.opts['--score']):
-            self.submit_threshold(self.best_pack)
-            self.best_pack = pack
-            if self.opts['--verbose'] >= 1:
-                print('New best pack found!')
-                print(self.best_pack)
+        elapsed = time.time() - start
+        metrics.OPEN_SECONDS.observe(elapsed, start)
+        if record is not None:
+            metrics.BYTES_RECEIVED.inc(received)
+            metrics.BYTES_SKIPPED.inc(skipped)
+            if self.opts['--verbose'] >= 2:
+                print('Pack page read: %d bytes, left unread: %d bytes' % (received, skipped))
+        elif r is not None:
+            if self.opts['--stream'] and not r:
+                account_read(r, len(r.content))
+            metrics.BYTES_RECEIVED.inc(len(r.content))
+        if self.pacer:
+            self.pacer.record(elapsed, r.status_code if r is not None else None)
+        if record is not None:
+            pack = Pack(record=record)
+        elif self.parsers and r:
+            pack = Pack(record=self.parsers.submit(parse_pack, r.content).result())
         else:
-            self.submit_threshold(pack)
-            self.submit_low(pack)
+            pack = Pack(r)
+        with metrics.CHECK_SECONDS.time():
+            submissions = self.consider(pack)
+        for title, submission in submissions:
+            self.submit(title, submission)
+        if metrics.tracer:
+            metrics.tracer.span('pack', start, time.time() - start, uid=pack.uid)
         return pack
 
+    def submit(self, title, pack):
+        """Save a pack through the submissions queue if there is one,
+right away otherwise."""
+        if self.submissions:
+            self.submissions.put(title, pack)
+        else:
+            self.save_pack(title, pack)
+
+    def save_params(self, pack, title=None):
+        """Build the form parameters needed to save a pack, asking for a title
+via stdin if none is provided."""
+        if not title:
+            title = input('Enter a title for the pack: ')
+        return list(pack.params) + [(pack.title_field, title)]
+
     def save_pack(self, title=None, pack=None):
         """Save pack to HearthPwn.com using request.Session object retrieved from login.
 If no pack is provided, use current best pack.
@@ -144,21 +287,20 @@ Returns the request.Request object of the saved pack."""
         pack = pack or self.best_pack
         if pack.score == 0:
             raise PackError("Invalid pack")
-        hidden_fields = (pack.soup.find('form', class_='pack-save-form')
-                         .find_all('input', type='hidden'))
-        params = [(i['name'], i['value']) for i in hidden_fields]
-        title_tag = (pack.soup.find('form', class_='pack-save-form')
-                     .find('input', id='field-title'))
-        if not title:
-            title = input('Enter a title for the pack: ')
-        params += [(title_tag['name'], title)]
+        params = self.save_params(pack, title)
         if self.opts['--verbose'] >= 2:
             print('Save pack request params:')
             print(params)
         try:
-            r = self.session.post(PACKS_ENDPOINT, data=params, timeout=5,
-                                  headers={'Referer': PACKS_FRONTPOINT[self.opts['PACK_TYPE']]})
+            with metrics.SAVE_SECONDS.time():
+                r = self.session.post(PACKS_ENDPOINT, data=params, timeout=5,
+                                      headers={'Referer': PACKS_FRONTPOINT[self.opts['PACK_TYPE']]})
         except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            r = None
+        (metrics.PACKS_SUBMITTED if r else metrics.SAVES_FAILED).inc()
+        if self.journal:
+            self.journal.record_save(pack, params[-1][1], bool(r))
+        if r is None:
             raise PackError("Unable to submit pack")
         if r:
             pack.submitted = True
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: parser.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, unicode_literals
+
+import codecs
+try:
+    from html.parser import HTMLParser
+except ImportError:
+    from HTMLParser import HTMLParser
+
+MARKERS = ('pack-score', 'pack-results', 'pack-save-form')
+
+def card_name(card_id, href):
+    return href.replace('/cards/%d-' % (card_id), '').replace('-', ' ')
+
+
+class ParsingDone(Exception):
+    pass
+
+
+class PackParser(HTMLParser):
+    """Incremental extractor of a pack simulator page.
+Only looks at the pack-score span, the pack-results list and the
+pack-save-form inputs: everything before the first of them is skipped
+without being tokenized, and tokenizing stops once all three have been seen.
+Data can be fed in chunks, either bytes or text."""
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.score = None
+        self.cards = []
+        self.params = []
+        self.title_field = None
+        self.done = False
+        self._skipped = ''
+        self._results = 0
+        self._results_done = False
+        self._form = 0
+        self._form_done = False
+        self._card = None
+
+    def feed(self, data):
+        if self.done:
+            return
+        if isinstance(data, bytes):
+            data = self.decoder.decode(data)
+        if self._skipped is not None:
+            data = self._skip(self._skipped + data)
+            if data is None:
+                return
+        try:
+            HTMLParser.feed(self, data)
+        except ParsingDone:
+            self.done = True
+
+    def _skip(self, data):
+        """Returns data from the start of the first tag holding one of the
+MARKERS, or None and keeps the last unterminated tag if there is none yet."""
+        found = [i for i in (data.find(marker) for marker in MARKERS) if i != -1]
+        if not found:
+            self._skipped = data[max(data.rfind('<'), 0):]
+            return None
+        self._skipped = None
+        return data[max(data.rfind('<', 0, min(found)), 0):]
+
+    @property
+    def record(self):
+        """Returns the (score, cards, params, title_field) tuple of the page,
+score being 0 if the page is not a pack."""
+        self._end_card()
+        if self.score is None or not self._results_done or not self._form_done:
+            return (0, [], [], None)
+        return (self.score, self.cards, self.params, self.title_field)
+
+    def _end_card(self):
+        card = self._card
+        if card is None:
+            return
+        self._card = None
+        src = card['video'] if card['golden'] else card['img']
+        self.cards.append((card['id'], card['golden'],
+                           card_name(card['id'], card['href']),
+                           src.get('data-gifurl' if card['golden'] else 'src'),
+                           int(src['width']), int(src['height'])))
+
+    def _check_done(self):
+        if self.score is not None and self._results_done and self._form_done:
+            raise ParsingDone()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if self._results:
+            if tag == 'ul':
+                self._results += 1
+            elif tag == 'li':
+                self._end_card()
+                self._card = {'id': int(attrs['data-id']),
+                              'golden': 'is-gold' in classes,
+                              'href': None, 'img': None, 'video': None}
+            elif self._card is not None:
+                if tag == 'a' and 'card-front' in classes and self._card['href'] is None:
+                    self._card['href'] = attrs['href']
+                elif tag in ('img', 'video') and self._card[tag] is None:
+                    self._card[tag] = attrs
+        elif self._form:
+            if tag == 'form':
+                self._form += 1
+            elif tag == 'input':
+                if attrs.get('type') == 'hidden':
+                    self.params.append((attrs['name'], attrs.get('value', '')))
+                if attrs.get('id') == 'field-title' and self.title_field is None:
+                    self.title_field = attrs['name']
+        elif tag == 'span' and 'pack-score' in classes and self.score is None:
+            self.score = int(attrs['data-score'])
+            self._check_done()
+        elif tag == 'ul' and 'pack-results' in classes and not self._results_done:
+            self._results = 1
+        elif tag == 'form' and 'pack-save-form' in classes and not self._form_done:
+            self._form = 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self._results:
+            if tag == 'li':
+                self._end_card()
+            elif tag == 'ul':
+                self._results -= 1
+                if not self._results:
+                    self._end_card()
+                    self._results_done = True
+                    self._check_done()
+        elif self._form and tag == 'form':
+            self._form -= 1
+            if not self._form:
+                self._form_done = True
+                self._check_done()
+
+
+def parse_pack(content):
+    """Parse a pack simulator page with PackParser.
+Returns the (score, cards, params, title_field) tuple of the page, cards
+being (card_id, golden, name, img_src, width, height) tuples."""
+    parser = PackParser()
+    parser.feed(content)
+    return parser.record
+
+
+def parse_pack_soup(content):
+    """Reference implementation of parse_pack, building the whole page with
+BeautifulSoup."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    score = int(soup.find('span', class_='pack-score')['data-score'])
+    cards = []
+    for li in soup.find('ul', class_='pack-results').find_all('li'):
+        card_id = int(li['data-id'])
+        golden = "is-gold" in li.attrs['class']
+        href = li.find('a', class_='card-front')['href']
+        if golden:
+            src = li.find('video')
+            img_src = src['data-gifurl']
+        else:
+            src = li.find('img')
+            img_src = src['src']
+        cards.append((card_id, golden, card_name(card_id, href),
+                      img_src, int(src['width']), int(src['height'])))
+    form = soup.find('form', class_='pack-save-form')
+    params = [(i['name'], i['value']) for i in form.find_all('input', type='hidden')]
+    title_field = form.find('input', id='field-title')['name']
+    return (score, cards, params, title_field)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: profiling.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import simplejson
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from hearthpacks import metrics
+
+MAX_EVENTS = 1000000
+TOP_FUNCTIONS = 25
+PHASES = (metrics.LOGIN_SECONDS, metrics.OPEN_SECONDS, metrics.PARSE_SECONDS,
+          metrics.CHECK_SECONDS, metrics.SAVE_SECONDS, metrics.IMAGE_SECONDS)
+
+class Tracer(object):
+    """Collect spans as Chrome trace events, to be loaded in
+chrome://tracing or https://ui.perfetto.dev.
+Stops recording after MAX_EVENTS spans."""
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+        self.origin = time.time()
+
+    def span(self, name, start, duration, **args):
+        if len(self.events) >= MAX_EVENTS:
+            return
+        event = {'name': name, 'ph': 'X', 'pid': self.pid,
+                 'tid': threading.current_thread().ident,
+                 'ts': int((start - self.origin) * 1000000),
+                 'dur': int(duration * 1000000)}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            simplejson.dump({'traceEvents': self.events,
+                             'displayTimeUnit': 'ms'}, f)
+
+
+def report(profiler, elapsed):
+    """Returns the time spent in each phase of the pack lifecycle (fetching
+the page, parsing it into a Pack and its Cards, checking the thresholds and
+submitting), followed by the functions of the profiled thread taking the
+most time."""
+    lines = ['%-8s %8s %10s %10s %10s %7s' % ('phase', 'count', 'total s',
+                                              'mean ms', 'p99 ms', 'of run')]
+    for histogram in PHASES:
+        lines.append('%-8s %8d %10.3f %10.2f %10.1f %6.1f%%' % (
+            histogram.labels['phase'], histogram.count, histogram.sum,
+            histogram.sum / max(histogram.count, 1) * 1000,
+            histogram.quantile(0.99) * 1000,
+            histogram.sum / max(elapsed, 1e-9) * 100))
+    lines.append('%-8s %8s %10.3f' % ('run', '', elapsed))
+    if profiler:
+        stream = StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('tottime').print_stats(TOP_FUNCTIONS)
+        lines.append(stream.getvalue())
+    return '\n'.join(lines)
+
+def run_profiled(opts, run):
+    """Call run under cProfile if --profile is set, and tracing the pack
+lifecycle if --trace is set. The profile is saved in the --profile file,
+the trace in the --trace file, and the report is printed on stderr.
+Only the calling thread is profiled, the phases covering every thread."""
+    profiler = cProfile.Profile() if opts['--profile'] else None
+    if opts['--trace']:
+        metrics.tracer = Tracer()
+    start = time.time()
+    try:
+        return profiler.runcall(run) if profiler else run()
+    finally:
+        elapsed = time.time() - start
+        tracer, metrics.tracer = metrics.tracer, None
+        if tracer:
+            tracer.write(opts['--trace'])
+        if profiler:
+            profiler.dump_stats(opts['--profile'])
+        print(report(profiler, elapsed), file=sys.stderr)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: sketch.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, division
+
+import math
+
+GROWTH = 1.05
+WARMUP = 100
+
+class ScoreSketch(object):
+    """Constant memory estimate of a score distribution.
+Scores are counted in logarithmic buckets, each one GROWTH times wider than
+the previous, so quantiles are known within 5% whatever the number of
+packs opened (a few hundred buckets cover every possible score)."""
+    def __init__(self, growth=GROWTH):
+        self.log_growth = math.log(growth)
+        self.buckets = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def index(self, score):
+        return int(math.log(score) / self.log_growth) if score >= 1 else -1
+
+    def bounds(self, index):
+        """Returns the [low, high) range of the scores of a bucket. Only the
+lowest bucket is narrowed to the scores seen so far, the highest one being
+where better scores are expected."""
+        low = math.exp(index * self.log_growth) if index >= 0 else 0
+        high = math.exp((index + 1) * self.log_growth)
+        return max(low, self.min), high
+
+    def add(self, score):
+        index = self.index(score)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.min = score if self.min is None else min(self.min, score)
+        self.max = score if self.max is None else max(self.max, score)
+
+    def quantile(self, q):
+        """Returns the estimated score below which a fraction q of the packs fall."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            count = self.buckets[index]
+            if seen + count >= rank:
+                low, high = self.bounds(index)
+                return min(low + (high - low) * max(rank - seen, 0) / count, self.max)
+            seen += count
+        return self.max
+
+    def expected_gain(self, best, attempts):
+        """Returns the expected improvement over a best score of best brought
+by opening attempts more packs, that is the integral above best of the
+probability that one of them scores higher, the scores being spread evenly
+within each bucket."""
+        if not self.count or attempts <= 0:
+            return 0
+        gain = 0
+        below = 0
+        for index in sorted(self.buckets):
+            count = self.buckets[index]
+            low, high = self.bounds(index)
+            if high > best:
+                start = max(low, best)
+                middle = (start + high) / 2
+                cdf = (below + count * (middle - low) / (high - low)) / self.count
+                gain += (high - start) * (1 - cdf ** attempts)
+            below += count
+        return gain
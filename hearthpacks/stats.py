@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: stats.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import sys
+import math
+import time
+import sqlite3
+
+from hearthpacks.journal import segments, read_segment
+
+INDEX_NAME = 'index.sqlite'
+ACCOUNT_PREFIX = 'account-'
+COMMIT_EVERY = 10000
+CACHE_SIZE = 64 * 1024 * 1024
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packs (
+    uid TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    saved INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pack_cards (
+    pack INTEGER NOT NULL,
+    card_id INTEGER NOT NULL,
+    golden INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cards (
+    card_id INTEGER NOT NULL,
+    golden INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    img_src TEXT,
+    PRIMARY KEY (card_id, golden)
+);
+CREATE TABLE IF NOT EXISTS progress (
+    segment TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS packs_type_score ON packs (type, score);
+CREATE INDEX IF NOT EXISTS packs_score ON packs (score);
+CREATE INDEX IF NOT EXISTS packs_day_score ON packs (day, score);
+CREATE INDEX IF NOT EXISTS pack_cards_card ON pack_cards (card_id, golden);
+CREATE INDEX IF NOT EXISTS pack_cards_pack ON pack_cards (pack);
+CREATE INDEX IF NOT EXISTS cards_name ON cards (name COLLATE NOCASE);
+"""
+
+def journal_directories(directory):
+    """Returns the journal directory and the ones of the accounts run from
+a configuration file, kept in its subdirectories."""
+    directories = [directory]
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return directories
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith(ACCOUNT_PREFIX) and os.path.isdir(path):
+            directories.append(path)
+    return directories
+
+
+class Index(object):
+    """SQLite index of the packs of a journal, kept in INDEX_NAME next to
+its segments. Packs are indexed by type and score, day and card, and the
+cards seen are kept in a catalog along with their names. update only reads
+what was appended to the segments since the previous update."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+        self.db.execute('PRAGMA cache_size = -%d' % (CACHE_SIZE // 1024))
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self):
+        """Index the new records of the journal, returns how many were read."""
+        progress = dict(self.db.execute('SELECT segment, offset FROM progress'))
+        count = 0
+        for directory in journal_directories(self.directory):
+            for name in segments(directory):
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.directory)
+                offset = progress.get(key, 0)
+                try:
+                    if os.path.getsize(path) <= offset:
+                        continue
+                except OSError:
+                    continue
+                for offset, record in read_segment(path, offset):
+                    self.add(record)
+                    count += 1
+                    if not count % COMMIT_EVERY:
+                        self.save_progress(key, offset)
+                self.save_progress(key, offset)
+        return count
+
+    def save_progress(self, key, offset):
+        self.db.execute('INSERT OR REPLACE INTO progress VALUES (?, ?)', (key, offset))
+        self.db.commit()
+
+    def add(self, record):
+        event = record.get('event')
+        if event == 'open':
+            cursor = self.db.execute('INSERT OR IGNORE INTO packs (uid, type, score, ts, day) '
+                                     'VALUES (?, ?, ?, ?, ?)',
+                                     (record['uid'], record['type'], record['score'], record['ts'],
+                                      time.strftime('%Y-%m-%d', time.localtime(record['ts']))))
+            if cursor.rowcount:
+                self.db.executemany('INSERT INTO pack_cards VALUES (?, ?, ?)',
+                                    [(cursor.lastrowid, card_id, int(golden))
+                                     for card_id, golden in record.get('cards', ())])
+        elif event == 'save' and record.get('ok'):
+            self.db.execute('UPDATE packs SET saved = 1 WHERE uid = ?', (record['uid'],))
+        elif event == 'card':
+            self.db.execute('INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?)',
+                            (record['id'], int(record['golden']), record['name'],
+                             record.get('img_src')))
+
+    def card_ids(self, card):
+        """Returns the ids of the cards matching card, an id or a name."""
+        if card.isdigit():
+            return [int(card)]
+        return [row[0] for row in self.db.execute(
+            'SELECT DISTINCT card_id FROM cards WHERE name = ? COLLATE NOCASE', (card,))]
+
+    def card_names(self, keys):
+        """Returns the names of the (card_id, golden) keys found in the catalog."""
+        names = {}
+        for card_id, golden in keys:
+            row = self.db.execute('SELECT name FROM cards WHERE card_id = ? AND golden = ?',
+                                  (card_id, golden)).fetchone()
+            names[(card_id, golden)] = row[0] if row else '#%d' % (card_id)
+        return names
+
+    def types(self, pack_type=None):
+        if pack_type:
+            return [pack_type]
+        return [row[0] for row in self.db.execute('SELECT DISTINCT type FROM packs ORDER BY type')]
+
+    def summary(self, pack_type=None):
+        """Returns the (type, opened, saved, lowest, median, highest) of each
+pack type."""
+        rows = []
+        for name in self.types(pack_type):
+            count, saved, low, high = self.db.execute(
+                'SELECT COUNT(*), SUM(saved), MIN(score), MAX(score) FROM packs WHERE type = ?',
+                (name,)).fetchone()
+            if count:
+                rows.append((name, count, saved, low, self.percentile(name, 50), high))
+        return rows
+
+    def percentile(self, pack_type, q):
+        """Returns the score below which q percent of the packs of pack_type
+fall, by nearest rank, or None if there are none."""
+        count = self.db.execute('SELECT COUNT(*) FROM packs WHERE type = ?',
+                                (pack_type,)).fetchone()[0]
+        if not count:
+            return None
+        rank = min(max(int(math.ceil(q / 100 * count)) - 1, 0), count - 1)
+        return self.db.execute('SELECT score FROM packs WHERE type = ? ORDER BY score '
+                               'LIMIT 1 OFFSET ?', (pack_type, rank)).fetchone()[0]
+
+    def packs_with(self, card_ids, golden=None, pack_type=None, limit=10):
+        """Returns the (uid, type, score, ts, saved) of the best packs holding
+one of card_ids, golden or not if golden is set."""
+        if not card_ids:
+            return []
+        query = ('SELECT uid, type, score, ts, saved FROM packs WHERE rowid IN '
+                 '(SELECT pack FROM pack_cards WHERE card_id IN (%s)' %
+                 (', '.join('?' * len(card_ids))))
+        params = list(card_ids)
+        if golden is not None:
+            query += ' AND golden = ?'
+            params.append(int(golden))
+        query += ')'
+        if pack_type:
+            query += ' AND type = ?'
+            params.append(pack_type)
+        query += ' ORDER BY score DESC LIMIT ?'
+        params.append(limit)
+        return self.db.execute(query, params).fetchall()
+
+    def best_per_day(self, pack_type=None, limit=10):
+        """Returns the (day, uid, type, score, saved) of the best pack of each
+of the last limit days, most recent first."""
+        query = 'SELECT day, uid, type, MAX(score), saved FROM packs'
+        params = []
+        if pack_type:
+            query += ' WHERE type = ?'
+            params.append(pack_type)
+        query += ' GROUP BY day ORDER BY day DESC LIMIT ?'
+        params.append(limit)
+        return self.db.execute(query, params).fetchall()
+
+    def cards_of(self, uid):
+        return [tuple(row) for row in self.db.execute(
+            'SELECT card_id, golden FROM pack_cards WHERE pack = '
+            '(SELECT rowid FROM packs WHERE uid = ?)', (uid,))]
+
+
+def format_ts(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+def run(opts):
+    """Answer the query of the stats command from the index of --journal,
+updating it first."""
+    if not opts['--journal'] or not os.path.isdir(opts['--journal']):
+        print('Error: stats needs the --journal directory of previous runs', file=sys.stderr)
+        return 1
+    index = Index(opts['--journal'])
+    try:
+        start = time.time()
+        count = index.update()
+        if opts['--verbose'] >= 1:
+            print('Indexed %d new records in %.2fs' % (count, time.time() - start))
+        pack_type = opts['PACK_TYPE']
+        if opts['--card']:
+            card_ids = index.card_ids(opts['--card'])
+            if not card_ids:
+                print('Error: no card named %s in the catalog' % (opts['--card']),
+                      file=sys.stderr)
+                return 1
+            rows = index.packs_with(card_ids, True if opts['--golden'] else None,
+                                    pack_type, opts['--limit'])
+            print('%-19s %-6s %8s %5s  %s' % ('opened', 'type', 'score', 'saved', 'cards'))
+            for uid, name, score, ts, saved in rows:
+                cards = index.cards_of(uid)
+                names = index.card_names(cards)
+                print('%-19s %-6s %8d %5s  %s' % (
+                    format_ts(ts), name, score, 'yes' if saved else 'no',
+                    ', '.join(names[card] + (' (Golden)' if card[1] else '')
+                              for card in cards)))
+        elif opts['--percentile'] is not None:
+            print('%-6s %10s' % ('type', 'p%g' % (opts['--percentile'])))
+            for name in index.types(pack_type):
+                score = index.percentile(name, opts['--percentile'])
+                if score is not None:
+                    print('%-6s %10d' % (name, score))
+        elif opts['--by-day']:
+            print('%-10s %-6s %8s %5s  %s' % ('day', 'type', 'score', 'saved', 'uid'))
+            for day, uid, name, score, saved in index.best_per_day(pack_type, opts['--limit']):
+                print('%-10s %-6s %8d %5s  %s' % (day, name, score,
+                                                  'yes' if saved else 'no', uid))
+        else:
+            print('%-6s %8s %8s %8s %8s %8s' % ('type', 'opened', 'saved',
+                                                 'lowest', 'median', 'highest'))
+            for row in index.summary(pack_type):
+                print('%-6s %8d %8d %8d %8d %8d' % row)
+    finally:
+        index.close()
+    return 0
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: submit.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import
+
+import sys
+import threading
+from retry.api import retry_call
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from hearthpacks import metrics
+from hearthpacks.packs import PackError
+from hearthpacks.transport import BACKOFF_FACTOR
+
+QUEUE_SIZE = 64
+
+class SubmissionQueue(object):
+    """Save packs from background threads.
+Packs wait in a bounded queue, so the opening loop only blocks when more
+than size submissions are pending. Failed submissions are retried --retries
+times with an exponential backoff, then reported and given up. Any other
+error of a submission is reported right away."""
+    def __init__(self, pack_opener, workers=1, size=QUEUE_SIZE):
+        self.pack_opener = pack_opener
+        self.tries = pack_opener.opts['--retries'] + 1
+        self.queue = queue.Queue(size)
+        metrics.SUBMISSION_QUEUE.set_function(self.queue.qsize)
+        self.failed = 0
+        self.closed = False
+        self.threads = [threading.Thread(target=self.run) for _ in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def put(self, title, pack):
+        self.queue.put((title, pack))
+
+    def run(self):
+        for title, pack in iter(self.queue.get, None):
+            try:
+                retry_call(self.pack_opener.save_pack, fargs=[title, pack],
+                           exceptions=PackError, tries=self.tries,
+                           delay=BACKOFF_FACTOR, backoff=2, logger=None)
+            except Exception as e:
+                self.failed += 1
+                print('%s: %s' % (e, title), file=sys.stderr)
+
+    def close(self):
+        """Stop the workers once every pending pack has been submitted or
+given up."""
+        if self.closed:
+            return
+        self.closed = True
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
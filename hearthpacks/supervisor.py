@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: supervisor.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import time
+import signal
+import multiprocessing
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from hearthpacks import metrics
+
+MAX_RESTARTS = 3
+RESTART_DELAY = 5
+POLL_INTERVAL = 0.5
+NORMAL_EXITS = (0, 2)
+
+def account_opts(opts, account, index):
+    """Returns the options of an account, its own keys overriding the global
+ones. The journal of each account is kept in its own subdirectory and the
+metrics port is shifted by the index of the account."""
+    account_opts = dict(opts, **account)
+    del account_opts['accounts']
+    account_opts['--config'] = None
+    account_opts['PACK_TYPE'] = account_opts['PACK_TYPE'].lower()
+    if account_opts['--journal'] and '--journal' not in account:
+        account_opts['--journal'] = os.path.join(account_opts['--journal'],
+                                                 'account-%d' % (index))
+    if account_opts['--metrics-port'] and '--metrics-port' not in account:
+        account_opts['--metrics-port'] += index
+    return account_opts
+
+def work(index, opts, results):
+    """Open packs for one account, then report its stats to results, even
+if the console crashed."""
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if opts['--async']:
+        from hearthpacks.aio import AsyncConsole as Console
+    else:
+        from hearthpacks.console import Console
+    console = Console(opts)
+    try:
+        sys.exit(console.run())
+    finally:
+        best = console.pack_opener.best_pack if console.pack_opener else None
+        results.put((index, {
+            'opened': metrics.PACKS_OPENED.value,
+            'failed': metrics.PACKS_FAILED.value,
+            'submitted': metrics.PACKS_SUBMITTED.value,
+            'best_score': best.score if best else 0,
+            'best_pack': str(best) if best and best.score else None,
+        }))
+        results.close()
+        results.join_thread()
+
+
+class Worker(object):
+    def __init__(self, opts, index):
+        self.opts = opts
+        self.index = index
+        self.name = opts.get('email') or 'anonymous %d' % (index)
+        self.process = None
+        self.restarts = 0
+        self.restart_at = None
+        self.results = []
+
+    def start(self, results):
+        self.process = multiprocessing.Process(target=work,
+                                               args=(self.index, self.opts, results),
+                                               name='hearthpacks-%d' % (self.index))
+        self.process.start()
+
+    def total(self, key):
+        return sum(result[key] for result in self.results)
+
+    def best(self):
+        return max(self.results, key=lambda result: result['best_score']) if self.results else None
+
+
+class Supervisor(object):
+    """Run one console worker process per account of the configuration file,
+restarting the ones that crash up to MAX_RESTARTS times, then print the
+combined stats and best packs."""
+    def __init__(self, opts):
+        self.opts = opts
+        self.workers = [Worker(account_opts(opts, account, i), i)
+                        for i, account in enumerate(opts['accounts'])]
+        self.results = multiprocessing.Queue()
+        self.stopping = False
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def collect(self, timeout=POLL_INTERVAL):
+        while True:
+            try:
+                index, result = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            self.workers[index].results.append(result)
+            timeout = 0
+
+    def supervise(self):
+        running = True
+        while running:
+            self.collect()
+            running = False
+            for worker in self.workers:
+                if worker.process.is_alive():
+                    running = True
+                elif worker.restart_at is not None:
+                    if self.stopping:
+                        worker.restart_at = None
+                    elif time.time() >= worker.restart_at:
+                        worker.restart_at = None
+                        worker.start(self.results)
+                    running = True
+                elif (worker.process.exitcode not in NORMAL_EXITS and
+                      not self.stopping and worker.restarts < MAX_RESTARTS):
+                    worker.restarts += 1
+                    worker.restart_at = time.time() + RESTART_DELAY * worker.restarts
+                    print('%s stopped with exit code %s, restarting it (%d/%d)'
+                          % (worker.name, worker.process.exitcode,
+                             worker.restarts, MAX_RESTARTS), file=sys.stderr)
+                    running = True
+        self.collect(0)
+
+    def summary(self):
+        lines = ['%-30s %-6s %8s %8s %9s %10s %8s %5s' % (
+            'account', 'type', 'opened', 'failed', 'submitted', 'best', 'restarts', 'exit')]
+        best_worker, best = None, None
+        for worker in self.workers:
+            worker_best = worker.best()
+            lines.append('%-30s %-6s %8d %8d %9d %10d %8d %5s' % (
+                worker.name, worker.opts['PACK_TYPE'], worker.total('opened'),
+                worker.total('failed'), worker.total('submitted'),
+                worker_best['best_score'] if worker_best else 0,
+                worker.restarts, worker.process.exitcode))
+            if (worker_best and worker_best['best_pack'] and
+                (best is None or worker_best['best_score'] > best['best_score'])):
+                best_worker, best = worker, worker_best
+        lines.append('%-30s %-6s %8d %8d %9d' % (
+            'total', '', sum(worker.total('opened') for worker in self.workers),
+            sum(worker.total('failed') for worker in self.workers),
+            sum(worker.total('submitted') for worker in self.workers)))
+        if best:
+            lines.append('The best pack was opened by %s:' % (best_worker.name))
+            lines.append(best['best_pack'])
+        return '\n'.join(lines)
+
+    def run(self):
+        """Returns 0 if every worker succeeded, the highest exit code otherwise."""
+        handler = signal.signal(signal.SIGINT, self.stop)
+        try:
+            for worker in self.workers:
+                worker.start(self.results)
+            self.supervise()
+        finally:
+            signal.signal(signal.SIGINT, handler)
+        print(self.summary())
+        return max(abs(worker.process.exitcode or 0) for worker in self.workers)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: transport.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+from __future__ import absolute_import, division
+
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import urlparse
+from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.util.request import ACCEPT_ENCODING
+from hearthpacks import metrics
+
+IMAGE_THREADS = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+PRECONNECT_MARGIN = 0.2
+ENDPOINT_PATHS = (('simulator', '/packs/simulator/'), ('save', '/packs/save'),
+                  ('login', '/login'))
+
+def make_session(opts):
+    """Returns a requests.Session object whose connection pools hold enough
+connections for --workers openers and the image loaders, retrying
+idempotent requests --retries times with an exponential backoff."""
+    session = requests.Session()
+    retries = Retry(total=opts['--retries'], backoff_factor=BACKOFF_FACTOR,
+                    status_forcelist=RETRY_STATUSES)
+    adapter = HTTPAdapter(pool_maxsize=max(opts['--workers'], IMAGE_THREADS),
+                          max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    session.hooks['response'].append(account_response)
+    return session
+
+def endpoint(url):
+    """Returns which of metrics.ENDPOINTS url belongs to, anything
+that is not a HearthPwn.com page being a card image."""
+    path = urlparse(url).path
+    for name, prefix in ENDPOINT_PATHS:
+        if path.startswith(prefix):
+            return name
+    return 'image'
+
+def headers_size(headers):
+    return sum(len(name) + len(value) + 4 for name, value in headers.items()) + 2
+
+def account_read(r, decoded):
+    """Count the exchange of r in the metrics, decoded being the number of
+bytes of its body read once decoded. The request and status lines and the
+headers are counted as sent by HTTP/1.1, the bodies as on the wire."""
+    request = r.request
+    body = request.body or b''
+    sent = (len(request.method) + len(request.path_url) + 11 +
+            headers_size(request.headers) + len(body))
+    received = (len(r.reason or '') + 15 + headers_size(r.headers) +
+                (r.raw.tell() if r.raw is not None else decoded))
+    metrics.account(endpoint(request.url), sent, received, decoded,
+                    r.headers.get('Content-Encoding', 'identity') != 'identity',
+                    r.status_code == 304)
+
+def account_response(r, *args, **kwargs):
+    """Response hook counting every exchange of a session in the metrics.
+Streamed responses are left to their reader, which calls account_read once
+done."""
+    if not kwargs.get('stream'):
+        account_read(r, len(r.content))
+    return r
+
+def pools(session):
+    adapters = []
+    for adapter in session.adapters.values():
+        if adapter not in adapters:
+            adapters.append(adapter)
+    for adapter in adapters:
+        manager = getattr(adapter, 'poolmanager', None)
+        if manager is None:
+            continue
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is not None:
+                yield pool
+
+def connection_pool(session, url):
+    """Returns the urllib3 pool the session uses for requests to url."""
+    adapter = session.get_adapter(url)
+    if hasattr(adapter, 'get_connection_with_tls_context'):
+        request = requests.Request('GET', url).prepare()
+        settings = session.merge_environment_settings(url, {}, None, None, None)
+        return adapter.get_connection_with_tls_context(request, settings['verify'])
+    return adapter.get_connection(url)
+
+def preconnect(session, url, count=1):
+    """Make sure up to count connections to the host of url are open and
+idle in the session pool, so the next requests skip the TCP and TLS
+handshakes. Connections dropped by the server are reopened."""
+    try:
+        pool = connection_pool(session, url)
+        connections = [pool._get_conn() for _ in range(count)]
+    except Exception:
+        return
+    for connection in connections:
+        try:
+            if connection.sock is None:
+                connection.connect()
+        except Exception:
+            connection.close()
+        finally:
+            pool._put_conn(connection)
+
+def idle(session, url, seconds, count=1):
+    """Sleep for seconds, reopening the connections to url near the end
+if the server has closed them in the meantime."""
+    if seconds <= 0:
+        return
+    start = time.time()
+    time.sleep(max(seconds - PRECONNECT_MARGIN, 0))
+    preconnect(session, url, count)
+    time.sleep(max(seconds - (time.time() - start), 0))
+
+def connection_stats(session):
+    """Returns the (requests, new connections) counts of the session pools."""
+    requests_count, connections_count = 0, 0
+    for pool in pools(session):
+        requests_count += pool.num_requests
+        connections_count += pool.num_connections
+    return requests_count, connections_count
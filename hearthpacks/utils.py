@@ -8,7 +8,14 @@
 
 from __future__ import absolute_import
 
+import os
+import errno
 import signal
+import tempfile
+import threading
+import time
+
+replace = getattr(os, 'replace', os.rename)
 
 class InterruptedHandlerGenerator(object):
     def __init__(self, iterable, sig=signal.SIGINT):
@@ -45,3 +52,65 @@ class InterruptedHandlerGenerator(object):
         signal.signal(self.sig, self.original_handler)
         self.released = True
         return True
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket, refilled at `rate` tokens per second.
+Holds at most `capacity` tokens, so bursts are bounded."""
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def set_rate(self, rate):
+        """Change the refill rate, the tokens earned so far being kept."""
+        with self.lock:
+            self.refill()
+            self.rate = float(rate)
+
+    def reserve(self):
+        """Take a token, returns the number of seconds to wait before using it."""
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def ensure_dir(path):
+    """Create the directory path and its parents if needed."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+def atomic_write(directory, filename, data):
+    """Write data to directory/filename through a temporary file renamed
+over it, so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        replace(tmp, os.path.join(directory, filename))
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
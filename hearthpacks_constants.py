@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# File: hearthpacks_constants.py
+# by Arzaroth Lekva
+# lekva@arzaroth.com
+#
+
+"""Version, pack URLs and default paths of HearthPacks.
+Kept outside of the hearthpacks package, whose import loads every mode, so
+that HearthPacks.py can print its help and version without it."""
+
+from __future__ import absolute_import
+
+import os
+
+VERSION = ("v4", "0", "9")
+
+PACKS_FRONTPOINT = {
+    'wild': "http://www.hearthpwn.com/packs/simulator/1",
+    # 'tgt': "http://www.hearthpwn.com/packs/simulator/2",
+    # 'wog': "http://www.hearthpwn.com/packs/simulator/3",
+    # 'golden-wog': "http://www.hearthpwn.com/packs/simulator/4",
+    # 'msg': "http://www.hearthpwn.com/packs/simulator/5",
+    # 'accurate-msg': "http://www.hearthpwn.com/packs/simulator/6",
+    'jtu': "http://www.hearthpwn.com/packs/simulator/7",
+    'koft': "http://www.hearthpwn.com/packs/simulator/8",
+}
+PACKS_TYPE = list(PACKS_FRONTPOINT.keys())
+PACKS_ENDPOINT = "http://www.hearthpwn.com/packs/save"
+CACHE_HOME = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                          os.path.join(os.path.expanduser('~'), '.cache'),
+                          'hearthpacks')
+CACHE_DIR = os.path.join(CACHE_HOME, 'images')
+SESSION_FILE = os.path.join(CACHE_HOME, 'sessions.json')
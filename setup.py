@@ -9,8 +9,7 @@
 
 from __future__ import print_function, absolute_import
 
-
-VERSION = ("v4", "0", "9")
+from hearthpacks_constants import VERSION
 
 if __name__ == '__main__':
     import os
@@ -31,6 +30,7 @@ if __name__ == '__main__':
         keywords='hearthpwn packs open spam',
 
         packages=find_packages('.'),
+        py_modules=['hearthpacks_constants'],
         scripts=['HearthPacks.py'],
 
         install_requires=open('requirements.txt').read().split('\n'),